@@ -0,0 +1,81 @@
+"""
+Game assets.
+Image files are read and decoded once and shared by the whole game. Surfaces are converted to the
+pixel format of the display, so blits don't convert pixels every frame, and scaled variants are
+cached for every resolution. Images can be decoded on a background thread while the menu is shown,
+so they are ready before the first game frame.
+"""
+
+import io
+import threading
+import pygame
+
+# images that are decoded in the background when the game starts
+PRELOAD_IMAGES = ["background.jpg", "maps/two-way.png"]
+
+
+class AssetManager:
+    """ Cache of image files, decoded images and their converted and scaled surfaces """
+
+    def __init__(self):
+        # decoding is done under the lock, so an image that is being decoded in the background is waited for
+        self.lock = threading.RLock()
+        self.files = {}
+        self.images = {}
+        self.surfaces = {}
+        self.thread = None
+
+    def read(self, path) -> bytes:
+        """ Returns contents of the file, files are read only once """
+
+        with self.lock:
+            if path not in self.files:
+                with open(path, "rb") as file:
+                    self.files[path] = file.read()
+            return self.files[path]
+
+    def load(self, path) -> pygame.Surface:
+        """ Returns decoded image in the format of the file, it can be used without a display """
+
+        with self.lock:
+            if path not in self.images:
+                self.images[path] = pygame.image.load(io.BytesIO(self.read(path)), path)
+            return self.images[path]
+
+    def get_image(self, path, size=None, alpha=False) -> pygame.Surface:
+        """
+        Returns image converted to the display format, needs a display and must be called from the main thread.
+        :param size: width and height of the scaled image, scaled images are cached for every size
+        :param alpha: keeps transparency of the image with convert_alpha
+        """
+
+        key = (path, tuple(size) if size is not None else None, alpha)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            if size is None:
+                image = self.load(path)
+                surface = image.convert_alpha() if alpha else image.convert()
+            else:
+                surface = pygame.transform.scale(self.get_image(path, alpha=alpha), size)
+            self.surfaces[key] = surface
+        return surface
+
+    def preload(self, paths):
+        """ Reads and decodes images on a background thread """
+
+        def load_all():
+            for path in paths:
+                self.load(path)
+
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=load_all, daemon=True)
+            self.thread.start()
+
+    def clear(self):
+        """ Drops converted surfaces, they must be converted again when the display mode changes """
+
+        self.surfaces.clear()
+
+
+# assets shared by the whole game
+assets = AssetManager()
@@ -3,6 +3,7 @@ Base app class written on module Pygame.
 """
 
 from update import *
+from profiler import *
 import pygame
 import time
 
@@ -21,12 +22,16 @@ class App:
             self.HEIGHT = display_height
             self.DISPLAY_MODE = display_mode
             self.DISPLAY = pygame.display.set_mode((self.WIDTH, self.HEIGHT), self.DISPLAY_MODE)
+            # converted images have the pixel format of the old display
+            assets.clear()
             if self.DISPLAY_MODE == pygame.FULLSCREEN:
                 self.WIDTH, self.HEIGHT = pygame.display.get_window_size()
             self.H_WIDTH = self.WIDTH / 2
             self.H_HEIGHT = self.HEIGHT / 2
 
         pygame.init()
+        # images are decoded while the display and the menu are created
+        assets.preload(PRELOAD_IMAGES)
 
         if app_name is None:
             self.NAME = "Base App"
@@ -41,14 +46,17 @@ class App:
         self.MAX_FPS = 60
         self.delta_time = 0.01
         self.RUN = True
-        self.last_time = time.time()
+        self.last_time = time.perf_counter()
 
+        self.renderer = DirtyRenderer(self)
+        self.profiler = Profiler()
         self.game = Game(self)
 
     def run(self):
         """ Main script loop """
 
         while self.RUN:
+            self.profiler.start("events")
             events = pygame.event.get()
             keys = pygame.key.get_pressed()
 
@@ -58,11 +66,15 @@ class App:
 
             mouse_buttons = pygame.mouse.get_pressed()
             mouse_position = list(pygame.mouse.get_pos())
-            now_time = time.time()
+            now_time = time.perf_counter()
             self.delta_time = now_time - self.last_time
             self.last_time = now_time
+            self.profiler.stop("events")
 
             self.game.update(mouse_buttons, mouse_position, events, keys)
 
-            pygame.display.update()
+            self.profiler.start("display")
+            self.renderer.present()
+            self.profiler.stop("display")
             self.CLOCK.tick(self.MAX_FPS)
+            self.profiler.next_frame()
@@ -0,0 +1,240 @@
+"""
+Benchmarks of the Root Wars engine hot paths.
+Runs headless with SDL dummy video driver and saves results to a json file,
+so results of different versions can be compared to catch regressions.
+
+Usage:
+    python benchmark.py --output results.json
+    python benchmark.py --output new.json --compare results.json
+"""
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import pygame
+from base_app import App
+from objects import *
+from maps import *
+from mapgen import *
+from bots import *
+
+# sizes of square grid maps used by map benchmarks
+MAP_SIZES = {"small": 16, "medium": 32, "huge": 64, "stress": 128}
+ENERGIES = [0, 1, 10, 20, 40]
+
+
+def measure(function, repeat=5, number=1, setup=None) -> dict:
+    """
+    Measures run time of the function.
+    :param repeat: how many times measurement is repeated
+    :param number: how many times function is called in one measurement
+    :param setup: function called before every measurement, its time is not measured
+    :return: median and min time of one function call in milliseconds
+    """
+
+    times = []
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for j in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number * 1000)
+    return {"median_ms": statistics.median(times), "min_ms": min(times), "repeat": repeat, "number": number}
+
+
+def create_app():
+    """ Creates headless app with a started game """
+
+    app = App("Root Wars Benchmark")
+    # benchmark games are not recorded into replays
+    app.game.RECORDING_ENABLED = False
+    app.game.change_mode("new game")
+    app.game.change_mode("game")
+    return app
+
+
+def use_grid_map(game, size):
+    """ Replaces map of the game with a square map of given size where every position holds a hexagon """
+
+    game.compiled_map = compile_grid_map([[1] * size for i in range(size)], game.hexagon_size, game.grid_hex_width)
+    game.grid_map = game.compiled_map.grid_map
+    game.hexagons = []
+    game.lines = []
+
+
+def bench_draw_hexagon(game, results):
+    """ Hexagon.draw_hexagon with empty and warm sprite cache at various energies """
+
+    hexagon = Hexagon(game, pos=[0, 0], hexagon_size=[game.hexagon_size, game.hexagon_size], hex_pos=[0, 0],
+                      color=game.player_color, outline_color=game.grid_hex_outline_color)
+    for energy in ENERGIES:
+        hexagon.energy = energy
+        results[f"draw_hexagon cold energy={energy}"] = measure(hexagon.draw_hexagon, repeat=20,
+                                                                setup=sprite_cache.clear)
+        results[f"draw_hexagon warm energy={energy}"] = measure(hexagon.draw_hexagon, repeat=20, number=100)
+
+
+def bench_neighbours(game, results):
+    """ Neighbour search for every hexagon of the map """
+
+    def search():
+        for obj in game.hexagons:
+            game.selected_hexagon = obj
+            game.get_nearby_hexagons_for_player()
+
+    def search_simulation():
+        for cell in game.simulation.cells:
+            game.simulation.get_targets(cell)
+
+    results["neighbours game"] = measure(search, repeat=10)
+    results["neighbours simulation"] = measure(search_simulation, repeat=10, number=10)
+    game.selected_hexagon = None
+    game.nearby_hexagons = []
+
+
+def bench_maps(game, results, sizes):
+    """ Map generation, map compilation, create_hex_grid and create_hex_grid_lines on maps of given sizes """
+
+    compiled_map = game.compiled_map
+    for name, size in sizes.items():
+        results[f"generate_map {name} {size}x{size}"] = measure(lambda: generate_map(0, size), repeat=3)
+        grid_map = [[1] * size for i in range(size)]
+        results[f"compile_grid_map {name} {size}x{size}"] = measure(
+            lambda: compile_grid_map(grid_map, game.hexagon_size, game.grid_hex_width), repeat=3)
+        use_grid_map(game, size)
+        results[f"create_hex_grid {name} {size}x{size}"] = measure(game.create_hex_grid, repeat=3,
+                                                                   setup=game.hexagons.clear)
+        results[f"create_hex_grid_lines {name} {size}x{size}"] = measure(game.create_hex_grid_lines, repeat=3,
+                                                                         setup=game.lines.clear)
+        results[f"create_hex_grid_lines {name} {size}x{size}"]["lines"] = len(game.lines)
+    game.compiled_map = compiled_map
+    game.grid_map = compiled_map.grid_map
+
+
+def bench_bot(game, results):
+    """ One rollout of the rollout bot from the current board """
+
+    board = game.simulation.copy()
+    board.bots = dict.fromkeys(board.roots)
+    results["bot rollout"] = measure(lambda: rollout(board.copy(), ENEMY, 30), repeat=5, number=20)
+
+
+def bench_frame(app, results, frames=300):
+    """ Full Game.update frame in game mode with one simulation tick per frame """
+
+    app.game.change_mode("game")
+    game = app.game
+    game.get_tick_count = lambda: 1
+    keys = pygame.key.get_pressed()
+    mouse_position = [app.WIDTH // 2, app.HEIGHT // 2]
+
+    def frame():
+        game.update((0, 0, 0), mouse_position, [], keys)
+        app.renderer.present()
+
+    results["game frame"] = measure(frame, repeat=5, number=frames // 5)
+
+
+def bench_zoom(app, results, frames=100):
+    """ Game.update frames that zoom the map out to the smallest zoom level and back, one level per frame """
+
+    game = app.game
+    keys = pygame.key.get_pressed()
+    mouse_position = [app.WIDTH // 2, app.HEIGHT // 2]
+    levels = len(game.get_zoom_levels()) - 1
+    wheel = itertools.cycle([-1] * levels + [1] * levels)
+
+    def frame():
+        event = pygame.event.Event(pygame.MOUSEWHEEL, x=0, y=next(wheel))
+        game.update((0, 0, 0), mouse_position, [event], keys)
+        app.renderer.present()
+
+    results["zoom frame"] = measure(frame, repeat=5, number=frames // 5)
+
+
+def get_version() -> str:
+    """ Returns current git commit of the game or 'unknown' """
+
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def compare(results, old_results, threshold) -> list:
+    """ Returns benchmarks that became slower than old results by more than given ratio """
+
+    regressions = []
+    for name, result in results.items():
+        old = old_results.get(name)
+        if old is not None and result["median_ms"] > old["median_ms"] * threshold:
+            regressions.append([name, old["median_ms"], result["median_ms"]])
+    return regressions
+
+
+def main():
+    """ Runs benchmarks, saves results and compares them with previous results """
+
+    parser = argparse.ArgumentParser(description="Root Wars engine benchmarks")
+    parser.add_argument("--output", default="benchmark.json", help="json file to save results to")
+    parser.add_argument("--compare", help="json file with previous results to compare with")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="slowdown ratio that is reported as a regression")
+    parser.add_argument("--maps", nargs="+", choices=list(MAP_SIZES), default=list(MAP_SIZES),
+                        help="map sizes to benchmark")
+    args = parser.parse_args()
+    # paths are given relative to the working directory, not to the game directory
+    args.output = os.path.abspath(args.output)
+    if args.compare:
+        args.compare = os.path.abspath(args.compare)
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    app = create_app()
+    results = {}
+    benchmarks = [
+        lambda: bench_draw_hexagon(app.game, results),
+        lambda: bench_neighbours(app.game, results),
+        lambda: bench_maps(app.game, results, {name: MAP_SIZES[name] for name in args.maps}),
+        lambda: bench_bot(app.game, results),
+        lambda: bench_frame(app, results),
+        lambda: bench_zoom(app, results),
+    ]
+    for benchmark in benchmarks:
+        benchmark()
+
+    data = {
+        "version": get_version(),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(data, file, indent=1)
+    for name, result in results.items():
+        print(f"{name:<45}{result['median_ms']:>12.3f} ms")
+
+    if args.compare:
+        with open(args.compare) as file:
+            old_data = json.load(file)
+        regressions = compare(results, old_data["results"], args.threshold)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: {old:.3f} ms -> {new:.3f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
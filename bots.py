@@ -0,0 +1,210 @@
+"""
+Root Wars bots.
+Rollout bot plays random games forward from every possible move on headless copies of the game rules
+and picks the move with the best mean score. Rollouts run on a process pool between bot turns,
+so the game loop only submits searches and collects finished results without waiting.
+"""
+
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from simulation import *
+
+# copy of the game made for every worker process, only its board state is replaced by searches
+worker_simulation = None
+
+
+def init_worker(simulation):
+    """ Remembers the map of the game in the worker process """
+
+    global worker_simulation
+    worker_simulation = simulation
+
+
+def get_moves(simulation, player) -> list:
+    """ Returns all moves the player can make, None means waiting for energy """
+
+    moves = [None]
+    for source in simulation.get_player_cells(player):
+        if simulation.energy[source] > 1:
+            moves.extend((source, target) for target in simulation.get_targets(source))
+    return moves
+
+
+def evaluate(simulation, player) -> float:
+    """ Returns score of the game for the player from 0 (lost) to 1 (won) """
+
+    if simulation.winner is not None:
+        return float(simulation.winner == player)
+    mine = simulation.owner == player
+    theirs = (simulation.owner != player) & (simulation.owner != NEUTRAL)
+    # cells count more than energy, full energy is worth one cell
+    score = np.count_nonzero(mine) + simulation.energy[mine].sum() / simulation.max_energy
+    other_score = np.count_nonzero(theirs) + simulation.energy[theirs].sum() / simulation.max_energy
+    return 0.5 + 0.5 * (score - other_score) / max(score + other_score, 1)
+
+
+def rollout(simulation, player, depth) -> float:
+    """ Plays given number of turns with random moves of all players and returns score of the game for the player """
+
+    for i in range(depth):
+        if simulation.winner is not None:
+            break
+        # ticks when nobody moves are skipped
+        simulation.counter += simulation.get_idle_ticks()
+        simulation.step()
+    return evaluate(simulation, player)
+
+
+def search(simulation, owner, energy, counter, player, moves, time_budget, depth, seed, rollouts=None) -> tuple:
+    """
+    Runs rollouts from the board state until the time budget is spent, choosing moves to try with UCB1.
+    Every move is tried at least once, even if that takes longer than the time budget.
+    :param simulation: game with the map, its board is replaced by given owner and energy arrays
+    :param rollouts: number of rollouts to run instead of the time budget, search with the same seed
+                     then always gives the same result
+    :return: number of rollouts and sum of scores for every move
+    """
+
+    simulation = simulation.copy()
+    simulation.random = random.Random(seed)
+    # rollouts play all players randomly
+    simulation.bots = dict.fromkeys(simulation.bots)
+    simulation.owner[:] = owner
+    simulation.energy[:] = energy
+    simulation.checksum = simulation.compute_checksum()
+    simulation.counter = counter
+    simulation.winner = None
+
+    visits = np.zeros(len(moves))
+    scores = np.zeros(len(moves))
+    deadline = time.perf_counter() + time_budget
+    while visits.min() == 0 or (time.perf_counter() < deadline if rollouts is None else visits.sum() < rollouts):
+        if visits.min() == 0:
+            i = int(visits.argmin())
+        else:
+            i = int(np.argmax(scores / visits + math.sqrt(2) * np.sqrt(math.log(visits.sum()) / visits)))
+        game = simulation.copy()
+        # copy continues the random sequence of the game, so every rollout gets its own seed to play differently
+        game.random = random.Random(simulation.random.getrandbits(64))
+        if moves[i] is not None:
+            game.move(*moves[i], energy=0)
+        game.regen([player])
+        visits[i] += 1
+        scores[i] += rollout(game, player, depth)
+    return visits, scores
+
+
+def get_best_move(moves, visits, scores):
+    """ Returns the move with the best mean score among moves that were tried """
+
+    means = np.where(visits > 0, scores / np.maximum(visits, 1), -np.inf)
+    return moves[int(means.argmax())]
+
+
+def search_in_worker(*args) -> tuple:
+    """ Runs search on the map of the worker process """
+
+    return search(worker_simulation, *args)
+
+
+class RolloutBot:
+    """
+    Monte Carlo bot that searches its next move on a process pool while the game goes on.
+    Search for the next turn starts right after the bot moves, so it has the whole wait between turns.
+    """
+
+    def __init__(self, simulation, workers=None, time_budget=0.5, depth=30, max_moves=64, rollouts=None):
+        """
+        :param simulation: game the bot plays, its map is sent to worker processes once
+        :param workers: number of worker processes, one per CPU up to 4 by default,
+                        0 searches in the calling process when the bot moves (for headless games)
+        :param time_budget: seconds one search may take, should be shorter than the wait between bot turns
+        :param depth: number of turns played in every rollout
+        :param max_moves: max number of moves that are compared in one search
+        :param rollouts: number of rollouts of one search instead of the time budget, with 0 workers the bot
+                         then makes the same moves in the same game on any machine, so matches replay from their seed
+        """
+
+        self.workers = min(4, os.cpu_count() or 1) if workers is None else workers
+        self.time_budget = time_budget
+        self.depth = depth
+        self.max_moves = max_moves
+        self.rollouts = rollouts
+
+        self.executor = None
+        if self.workers:
+            board = simulation.copy()
+            board.bots = dict.fromkeys(simulation.bots)
+            self.executor = ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(board,))
+        self.moves = []
+        self.futures = []
+        # closed bot makes random moves, its workers are stopped
+        self.closed = False
+
+    def get_search_moves(self, simulation, player) -> list:
+        """ Returns moves of the player compared by the search, random part of them if there are too many """
+
+        moves = get_moves(simulation, player)
+        if len(moves) > self.max_moves:
+            moves = [None] + simulation.random.sample(moves[1:], self.max_moves - 1)
+        return moves
+
+    def get_worker_rollouts(self):
+        """ Returns number of rollouts of every worker, None if searches are limited by time """
+
+        return None if self.rollouts is None else -(-self.rollouts // self.workers)
+
+    def start_search(self, simulation, player):
+        """ Starts search of the best move for the board state """
+
+        self.moves = self.get_search_moves(simulation, player)
+        self.futures = [self.executor.submit(search_in_worker, simulation.owner, simulation.energy, simulation.counter,
+                                             player, self.moves, self.time_budget, self.depth,
+                                             simulation.random.getrandbits(32), self.get_worker_rollouts())
+                        for i in range(self.workers)]
+
+    def get_move(self, simulation, player):
+        """
+        Returns the move with the best mean score from the search started on the previous turn.
+        Makes a random move if the search is not finished or its move can't be made anymore, never waits for workers.
+        """
+
+        if self.closed:
+            return simulation.get_random_move(player)
+        if self.executor is None:
+            moves = self.get_search_moves(simulation, player)
+            # the move is made in the current tick, so rollouts start from the next one
+            visits, scores = search(simulation, simulation.owner, simulation.energy, simulation.counter + 1, player,
+                                    moves, self.time_budget, self.depth, simulation.random.getrandbits(32),
+                                    self.rollouts)
+            return get_best_move(moves, visits, scores)
+
+        move = simulation.get_random_move(player)
+        if self.futures and all(future.done() for future in self.futures):
+            visits = sum(future.result()[0] for future in self.futures)
+            scores = sum(future.result()[1] for future in self.futures)
+            best_move = get_best_move(self.moves, visits, scores)
+            if best_move is None or simulation.can_move(*best_move):
+                move = best_move
+        # late search is cancelled, its result would be outdated
+        for future in self.futures:
+            future.cancel()
+
+        # next search starts from the board that will be after this move, the energy tick and the end of the tick
+        board = simulation.copy()
+        if move is not None:
+            board.move(*move, energy=0)
+        board.regen([player])
+        board.counter += 1
+        self.start_search(board, player)
+        return move
+
+    def close(self):
+        """ Stops worker processes """
+
+        self.closed = True
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,151 @@
+"""
+Procedural map generator.
+Makes connected hexagon layouts of any size from a seed in the same grid map format as map images,
+so large maps can be played, stress-tested and benchmarked the same way as Two-Way.
+"""
+
+import numpy as np
+from maps import *
+
+
+def get_noise(rng, shape, scale, octaves=3) -> np.ndarray:
+    """
+    Returns smooth value noise in range [0, 1] for every grid map position.
+    :param scale: size of the biggest noise features in grid map positions
+    """
+
+    # grid map positions are placed on the screen like hexagons, so noise is sampled at their world positions
+    x = np.arange(shape[0])[:, None] * pow(3, 0.5)
+    y = np.arange(shape[1])[None, :] * 1.5
+    noise = np.zeros(shape)
+    amplitude = 1
+    for octave in range(octaves):
+        step = scale * pow(3, 0.5) / pow(2, octave)
+        lattice = rng.random((int(x.max() // step) + 2, int(y.max() // step) + 2))
+        x1, y1 = (x // step).astype(int), (y // step).astype(int)
+        tx, ty = x / step - x1, y / step - y1
+        # smoothstep makes lattice edges invisible
+        tx, ty = tx * tx * (3 - 2 * tx), ty * ty * (3 - 2 * ty)
+        top = lattice[x1, y1] * (1 - tx) + lattice[x1 + 1, y1] * tx
+        bottom = lattice[x1, y1 + 1] * (1 - tx) + lattice[x1 + 1, y1 + 1] * tx
+        noise += (top * (1 - ty) + bottom * ty) * amplitude
+        amplitude /= 2
+    return (noise - noise.min()) / max(noise.max() - noise.min(), 1e-9)
+
+
+def get_components(neighbours) -> np.ndarray:
+    """ Returns connected component label of every cell, cells of one component share the smallest index """
+
+    labels = np.arange(len(neighbours))
+    padded = np.append(labels, len(neighbours))
+    while True:
+        padded[:-1] = labels
+        new_labels = np.minimum(labels, padded[neighbours].min(axis=1))
+        # pointer jumping makes labels travel across the map in a few steps
+        new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
+
+
+def get_distances(neighbours, sources) -> tuple:
+    """
+    Returns number of steps from the nearest source to every cell and index of that source.
+    Unreachable cells have distance -1.
+    """
+
+    distance = np.full(len(neighbours), -1)
+    nearest = np.full(len(neighbours), -1)
+    distance[sources] = 0
+    nearest[sources] = np.arange(len(sources))
+    frontier = np.array(sources)
+    step = 0
+    while len(frontier):
+        step += 1
+        targets = neighbours[frontier]
+        origins = np.repeat(nearest[frontier], 6)
+        targets = targets.ravel()
+        new = (targets >= 0) & (distance[targets] == -1)
+        targets, origins = targets[new], origins[new]
+        targets, first = np.unique(targets, return_index=True)
+        distance[targets] = step
+        nearest[targets] = origins[first]
+        frontier = targets
+    return distance, nearest
+
+
+def choose_start_cells(rng, neighbours, count, attempts=16, starts=()) -> list:
+    """
+    Returns indexes of start cells that are far from each other and own territories of similar size.
+    Territory of a start cell is the part of the map that is closer to it than to the other start cells.
+    :param starts: indexes of start cells that are always kept, new ones are added after them
+    """
+
+    best_score = None
+    best = None
+    fixed = list(starts)
+    for attempt in range(attempts):
+        # every next start cell is a random cell from the part of the map that is far from the chosen ones
+        starts = list(fixed) or [int(rng.integers(len(neighbours)))]
+        while len(starts) < count:
+            distance, nearest = get_distances(neighbours, starts)
+            starts.append(int(rng.choice(np.nonzero(distance >= distance.max() * 0.7)[0])))
+        starts = starts[:count]
+        distance, nearest = get_distances(neighbours, starts)
+        territories = np.bincount(nearest, minlength=count)
+        pairwise = np.array([get_distances(neighbours, [start])[0][starts] for start in starts])
+        spread = pairwise[~np.eye(count, dtype=bool)].min() / max(pairwise.max(), 1) if count > 1 else 0
+        score = (territories.max() - territories.min()) / len(neighbours) * 2 - spread
+        if best_score is None or score < best_score:
+            best_score = score
+            best = starts
+    return best
+
+
+def get_start_cells(grid_map, start_cells, count, seed=None) -> list:
+    """
+    Returns start cells for given number of players on a map with fixed start cells.
+    The first start cells of the map are used as they are, cells of other players are chosen far from them.
+    """
+
+    if count <= len(start_cells):
+        return list(start_cells[:count])
+    cells = get_mask_cells(get_passable_mask(grid_map))
+    cell_index = {cell: i for i, cell in enumerate(cells)}
+    neighbours = get_neighbour_array(np.array(cells).reshape(-1, 2))
+    starts = choose_start_cells(np.random.default_rng(seed), neighbours, count,
+                                starts=[cell_index[tuple(cell)] for cell in start_cells])
+    return [cells[i] for i in starts]
+
+
+def generate_map(seed, size, start_count=2, fill=0.6, scale=8) -> tuple:
+    """
+    Generates connected map.
+    :param seed: the same seed always makes the same map
+    :param size: grid map size, int for square maps or [width, height]
+    :param start_count: number of start cells
+    :param fill: part of hexagon positions that are kept before removing disconnected islands
+    :param scale: size of continents and lakes in grid map positions
+    :return: grid map and list of start cells
+    """
+
+    rng = np.random.default_rng(seed)
+    shape = (size, size) if isinstance(size, int) else tuple(size)
+    passable = get_passable_mask(np.ones(shape, dtype=bool))
+    noise = get_noise(rng, shape, scale)
+    grid_map = passable & (noise >= np.quantile(noise[passable], 1 - fill))
+
+    # only the biggest island is kept, so every cell can be reached from every start cell
+    cells = np.array(get_mask_cells(grid_map)).reshape(-1, 2)
+    neighbours = get_neighbour_array(cells)
+    labels = get_components(neighbours)
+    biggest = labels == np.bincount(labels).argmax()
+    grid_map[:] = False
+    grid_map[cells[biggest, 0], cells[biggest, 1]] = True
+
+    cells = cells[biggest]
+    neighbours = get_neighbour_array(cells)
+    if len(cells) < start_count:
+        raise ValueError(f"map of size {size} with seed {seed} has less than {start_count} cells")
+    starts = choose_start_cells(rng, neighbours, start_count)
+    return grid_map, [tuple(cells[i].tolist()) for i in starts]
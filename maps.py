@@ -0,0 +1,187 @@
+"""
+Root Wars maps.
+Map images are decoded into grid maps with pygame.surfarray in one pass and compiled into
+cell positions, neighbour table and grid lines built from it. Compiled maps are cached in memory
+and on disk, keyed by the hash of the map file, so restarts and large maps load fast.
+"""
+
+import hashlib
+import os
+import numpy as np
+import pygame
+from assets import *
+from objects import Hexagon
+from simulation import *
+
+# map images with start cells of the player and the enemy
+MAP_FILES = {"Two-Way": ["maps/two-way.png", [(8, 15), (8, 1)]]}
+# grid map sizes of maps made by the map generator
+GENERATED_MAP_SIZES = {"Generated": 100, "Generated Huge": 200}
+
+MAP_CACHE_DIR = os.path.join("maps", ".cache")
+MAP_CACHE_VERSION = 3
+
+# corners of the hexagon that point to its neighbours in the order of get_hex_offsets
+NEIGHBOUR_CORNERS = [1, 4, 0, 5, 2, 3]
+# indexes of get_hex_offsets that lead back from the neighbour
+OPPOSITE_NEIGHBOURS = [1, 0, 5, 4, 3, 2]
+
+# compiled maps that were already loaded by this process
+loaded_maps = {}
+# decoded map images that were already loaded by this process
+map_images = {}
+
+
+class CompiledMap:
+    """ Grid map with everything that can be computed from it before the game starts """
+
+    def __init__(self, grid_map, cells, adjacency, positions, lines):
+        self.grid_map = grid_map
+        self.cells = cells
+        self.adjacency = adjacency
+        self.positions = positions
+        self.lines = lines
+
+        cell_list = [tuple(cell) for cell in cells.tolist()]
+        self.neighbours = {cell: tuple(cell_list[i] for i in row if i >= 0)
+                           for cell, row in zip(cell_list, adjacency.tolist())}
+
+    def save(self, path):
+        """ Saves compiled map to a .npz file, the file is replaced only when it's fully written """
+
+        # other processes can write the same map at the same time, so every process has its own temporary file
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            np.savez_compressed(file, version=MAP_CACHE_VERSION, grid_map=self.grid_map, cells=self.cells,
+                                adjacency=self.adjacency, positions=self.positions, lines=self.lines)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """ Loads compiled map from a .npz file, returns None if the file was saved by other cache version """
+
+        with np.load(path) as data:
+            if int(data["version"]) != MAP_CACHE_VERSION:
+                return None
+            return cls(data["grid_map"], data["cells"], data["adjacency"], data["positions"], data["lines"])
+
+
+def decode_map_image(surface) -> np.ndarray:
+    """ Returns grid map of the map image, positions with opaque black pixels hold hexagons """
+
+    rgb = pygame.surfarray.array3d(surface)
+    alpha = pygame.surfarray.array_alpha(surface)
+    # map images are stored rotated, so the first axis of the grid map goes from right to left
+    return (np.all(rgb == 0, axis=2) & (alpha == 255))[::-1]
+
+
+def get_cell_positions(cells, hexagon_size) -> np.ndarray:
+    """ Returns world positions of hexagons on given grid map positions """
+
+    width = pow(3, 0.5) * hexagon_size
+    vertical_distance = 2 * hexagon_size * (3 / 4)
+    x = cells[:, 0] * width + np.where(cells[:, 1] % 2 == 0, width / 2, 0)
+    y = cells[:, 1] * vertical_distance
+    return np.stack([x, y], axis=1)
+
+
+def get_neighbour_array(cells) -> np.ndarray:
+    """
+    Returns array with indexes of the six neighbours of every cell in the order of get_hex_offsets.
+    Missing neighbours are -1.
+    """
+
+    shape = cells.max(axis=0) + 1 if len(cells) else np.zeros(2, dtype=int)
+    cell_index = np.full(shape, -1)
+    cell_index[cells[:, 0], cells[:, 1]] = np.arange(len(cells))
+    parity = cells[:, 1] % 2
+
+    neighbours = np.full((len(cells), 6), -1)
+    for i in range(6):
+        targets = cells + np.array([get_hex_offsets(0)[i], get_hex_offsets(1)[i]])[parity]
+        inside = np.all((targets >= 0) & (targets < shape), axis=1)
+        neighbours[inside, i] = cell_index[targets[inside, 0], targets[inside, 1]]
+    return neighbours
+
+
+def get_line_endpoints(cells, positions, hexagon_size, hexagon_width) -> np.ndarray:
+    """
+    Returns endpoints [x1, y1, x2, y2, x3, y3, x4, y4] of grid lines, one line for every pair of neighbour hexagons.
+    Every line has two strokes that go outwards from the corners of both hexagons that point to each other.
+    Their ends differ by a fraction of a pixel, so both are drawn to keep the picture of the grid.
+    """
+
+    grid_length = hexagon_size * 2
+    corners = np.array(Hexagon.get_points([hexagon_size // 2, hexagon_size // 2], hexagon_width), dtype=float)
+    angles = np.radians(np.arange(6) * 60 + 120)
+    directions = np.stack([np.sin(angles), np.cos(angles)], axis=1) * grid_length
+
+    neighbour_array = get_neighbour_array(cells)
+    lines = []
+    for i, corner in enumerate(NEIGHBOUR_CORNERS):
+        neighbours = neighbour_array[:, i]
+        # every pair of neighbours is found from both sides, only one of them makes a line
+        sources = np.nonzero(neighbours > np.arange(len(cells)))[0]
+        starts = positions[sources] + corners[corner]
+        back_corner = NEIGHBOUR_CORNERS[OPPOSITE_NEIGHBOURS[i]]
+        back_starts = positions[neighbours[sources]] + corners[back_corner]
+        lines.append(np.concatenate([starts, np.round(starts + directions[corner]),
+                                     back_starts, np.round(back_starts + directions[back_corner])], axis=1))
+    return np.concatenate(lines)
+
+
+def compile_grid_map(grid_map, hexagon_size, hexagon_width) -> CompiledMap:
+    """ Compiles grid map into cell positions, neighbour table and grid lines """
+
+    grid_map = np.array(grid_map, dtype=bool)
+    cell_list = get_mask_cells(get_passable_mask(grid_map))
+    cells = np.array(cell_list, dtype=np.int32).reshape(-1, 2)
+    # neighbours of every cell in board order, missing neighbours (-1) go last
+    adjacency = get_neighbour_array(cells)
+    adjacency = np.sort(np.where(adjacency < 0, len(cells), adjacency), axis=1)
+    adjacency = np.where(adjacency == len(cells), -1, adjacency).astype(np.int32)
+    positions = get_cell_positions(cells, hexagon_size)
+    lines = get_line_endpoints(cells, positions, hexagon_size, hexagon_width)
+    return CompiledMap(grid_map, cells, adjacency, positions, lines)
+
+
+def load_map(path, hexagon_size, hexagon_width) -> CompiledMap:
+    """ Returns compiled map of the map image, compiling it only if it's not cached """
+
+    file_hash = hashlib.sha1(assets.read(path)).hexdigest()
+    key = f"{file_hash}-{hexagon_size}-{hexagon_width}"
+    if key in loaded_maps:
+        return loaded_maps[key]
+
+    cache_path = os.path.join(MAP_CACHE_DIR, key + ".npz")
+    compiled_map = None
+    if os.path.exists(cache_path):
+        try:
+            compiled_map = CompiledMap.load(cache_path)
+        except Exception:
+            # broken cache file is compiled and written again
+            compiled_map = None
+    if compiled_map is None:
+        compiled_map = compile_grid_map(decode_map_image(assets.load(path)), hexagon_size, hexagon_width)
+        os.makedirs(MAP_CACHE_DIR, exist_ok=True)
+        compiled_map.save(cache_path)
+    loaded_maps[key] = compiled_map
+    return compiled_map
+
+
+def get_map(name, seed, players=2) -> tuple:
+    """ Returns grid map and start cells of the map with given name, generated maps depend on the seed """
+
+    # map generator is built on this module
+    from mapgen import generate_map, get_start_cells
+
+    if name in MAP_FILES:
+        path, start_cells = MAP_FILES[name]
+        if path not in map_images:
+            map_images[path] = decode_map_image(assets.load(path))
+        return map_images[path], get_start_cells(map_images[path], start_cells, players, seed)
+    if name in GENERATED_MAP_SIZES:
+        return generate_map(seed, GENERATED_MAP_SIZES[name], start_count=players)
+    if name.startswith("generated:"):
+        return generate_map(seed, int(name.split(":")[1]), start_count=players)
+    raise ValueError(f"unknown map {name}")
@@ -0,0 +1,603 @@
+"""
+Networked multiplayer.
+Server is authoritative: it runs all its matches on one asyncio loop at the game tick rate, applies
+moves sent by clients and sends every client only the cells that changed since the last update,
+together with the board checksum. Clients keep a copy of the board that is only changed by these
+updates, so the game is drawn the same way as a local match.
+
+Messages are frames with a size and a type, followed by a binary or json payload:
+    JOIN   client -> server  json with match name and options of a new match
+    MOVE   client -> server  source and target cells
+    START  server -> client  json with the player id and match options, packed grid map
+    DELTA  server -> client  tick, checksum and changed cells (x, y, owner, energy columns, zlib if big)
+    END    server -> client  winner
+    ERROR  server -> client  text of the error
+
+Usage:
+    python net.py serve --port 7777
+    python net.py play --host localhost --port 7777 --match room --players 4 --humans 2
+    python net.py bench --matches 1 10 50 100
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import queue
+import random
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+from simulation import *
+from maps import get_map
+
+DEFAULT_PORT = 7777
+# message types
+JOIN = 1
+MOVE = 2
+START = 3
+DELTA = 4
+END = 5
+ERROR = 6
+
+FRAME = struct.Struct("<IB")  # payload size, message type
+MOVE_MESSAGE = struct.Struct("<HHHH")  # source cell, target cell
+DELTA_HEADER = struct.Struct("<IQHB")  # tick, checksum, number of cells, compressed
+END_MESSAGE = struct.Struct("<b")  # winner
+# deltas that are bigger are compressed
+COMPRESS_SIZE = 128
+# clients that don't read their updates are disconnected
+MAX_WRITE_BUFFER = 1 << 20
+
+
+def send_message(writer, message_type, payload=b""):
+    """ Writes message to the stream """
+
+    writer.write(FRAME.pack(len(payload), message_type) + payload)
+
+
+async def read_message(reader) -> tuple:
+    """ Returns type and payload of the next message """
+
+    size, message_type = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return message_type, await reader.readexactly(size)
+
+
+def encode_delta(simulation) -> bytes:
+    """ Returns DELTA payload with cells changed since the last delta, forgets these changes """
+
+    xs, ys = np.nonzero(simulation.changed)
+    simulation.changed[:] = False
+    cells = (xs.astype("<u2").tobytes() + ys.astype("<u2").tobytes() +
+             simulation.owner[xs, ys].astype(np.int8).tobytes() + simulation.energy[xs, ys].astype("<i2").tobytes())
+    compressed = len(cells) > COMPRESS_SIZE
+    if compressed:
+        cells = zlib.compress(cells, 1)
+    return DELTA_HEADER.pack(simulation.counter, simulation.checksum, len(xs), compressed) + cells
+
+
+def decode_delta(payload) -> tuple:
+    """ Returns tick, checksum, cells as x and y arrays, owner and energy arrays of DELTA payload """
+
+    tick, checksum, count, compressed = DELTA_HEADER.unpack_from(payload)
+    cells = payload[DELTA_HEADER.size:]
+    if compressed:
+        cells = zlib.decompress(cells)
+    xs = np.frombuffer(cells, dtype="<u2", count=count)
+    ys = np.frombuffer(cells, dtype="<u2", count=count, offset=count * 2)
+    owner = np.frombuffer(cells, dtype=np.int8, count=count, offset=count * 4)
+    energy = np.frombuffer(cells, dtype="<i2", count=count, offset=count * 5)
+    return tick, checksum, (xs.astype(np.intp), ys.astype(np.intp)), owner, energy
+
+
+def get_match_options(options) -> dict:
+    """ Returns options of a new match with defaults for missing ones """
+
+    match_options = {"map": "Two-Way", "difficulty": "Normal", "speed": "Normal", "game_mode": "Classic",
+                     "players": 2, "humans": 2}
+    match_options.update({key: value for key, value in options.items() if key in match_options})
+    match_options["players"] = min(max(int(match_options["players"]), 2), MAX_PLAYERS)
+    match_options["humans"] = min(max(int(match_options["humans"]), 1), match_options["players"])
+    return match_options
+
+
+class Match:
+    """ Match of the server, the first players are humans and the others are played by random bots """
+
+    def __init__(self, server, name, options):
+        self.server = server
+        self.name = name
+        self.options = get_match_options(options)
+        self.seed = random.randrange(2 ** 32)
+        players, humans = self.options["players"], self.options["humans"]
+        self.grid_map, start_cells = get_map(self.options["map"], self.seed, players)
+        human_wait_ticks, bot_wait_ticks = DIFFICULTY_WAIT_TICKS[self.options["difficulty"]]
+        speed_factor = SPEED_FACTORS[self.options["speed"]]
+        max_energy = 20 if self.options["game_mode"] == "Fast" else 40
+        wait_ticks = [(human_wait_ticks if player <= humans else bot_wait_ticks) / speed_factor
+                      for player in range(1, players + 1)]
+        self.simulation = Simulation(self.grid_map, start_cells, max_energy, wait_ticks,
+                                     bots=range(humans + 1, players + 1), seed=self.seed)
+        self.humans = self.simulation.players[:humans]
+        # writers of the connected players and moves they sent since the last tick
+        self.writers = {}
+        self.moves = []
+        self.started = False
+        self.bytes_sent = 0
+
+    def join(self, writer) -> int:
+        """ Adds client to the first free side and returns its player id, starts the match when all have joined """
+
+        player = next(player for player in self.humans if player not in self.writers)
+        self.writers[player] = writer
+        if len(self.writers) == len(self.humans):
+            self.start()
+        return player
+
+    def start(self):
+        """ Sends match options and the map to all players """
+
+        shape = self.simulation.passable.shape
+        grid_map = np.packbits(np.asarray(self.grid_map, dtype=bool)).tobytes()
+        for player, writer in self.writers.items():
+            header = dict(self.options, player=player, map_seed=self.seed, seed=self.seed,
+                          start_cells=[list(self.simulation.roots[side]) for side in self.simulation.players],
+                          max_energy=self.simulation.max_energy,
+                          wait_ticks=[self.simulation.wait_ticks[side] for side in self.simulation.players],
+                          shape=list(shape), counter=self.simulation.counter, tick_rate=self.server.tick_rate)
+            header = json.dumps(header).encode()
+            self.send(writer, START, struct.pack("<I", len(header)) + header + grid_map)
+        self.simulation.changed[:] = False
+        self.started = True
+
+    def check_move(self, player, source, target) -> bool:
+        """
+        Checks the move sent by the player before it's queued.
+        :return: False if the source cell doesn't belong to the player, the board could change after the client sent it
+        """
+
+        shape = self.simulation.passable.shape
+        for cell in (source, target):
+            if cell[0] >= shape[0] or cell[1] >= shape[1] or not self.simulation.passable[cell]:
+                raise ValueError(f"cell {cell} is not on the board")
+        return self.simulation.owner[source] == player
+
+    def leave(self, player):
+        """ Removes the player, its cells become neutral and the match ends if only one player is left """
+
+        self.writers.pop(player, None)
+        if self.started and self.simulation.winner is None:
+            self.simulation.eliminate(player)
+            self.simulation.check_winner()
+            if self.simulation.winner is not None:
+                self.finish()
+
+    def send(self, writer, message_type, payload=b""):
+        """ Sends message to the client, clients that don't read their messages are disconnected """
+
+        if writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            writer.transport.abort()
+            return
+        send_message(writer, message_type, payload)
+        self.bytes_sent += FRAME.size + len(payload)
+
+    def broadcast(self, message_type, payload=b""):
+        """ Sends message to all players """
+
+        for writer in list(self.writers.values()):
+            self.send(writer, message_type, payload)
+
+    def finish(self):
+        """ Sends the last changes and the winner """
+
+        self.broadcast(DELTA, encode_delta(self.simulation))
+        self.broadcast(END, END_MESSAGE.pack(-1 if self.simulation.winner is None else self.simulation.winner))
+
+    def tick(self):
+        """ Applies received moves, makes one game tick and sends changes every few ticks """
+
+        if not self.started or self.simulation.winner is not None:
+            return
+        for player, source, target in self.moves:
+            if self.simulation.owner[source] == player:
+                self.simulation.move(source, target)
+        self.moves.clear()
+        self.simulation.step()
+        if self.simulation.winner is not None:
+            self.finish()
+        elif self.simulation.counter % self.server.send_ticks == 0 and self.simulation.changed.any():
+            self.broadcast(DELTA, encode_delta(self.simulation))
+
+
+class Server:
+    """ Authoritative server that hosts any number of matches on one loop """
+
+    def __init__(self, tick_rate=60, send_ticks=3):
+        """
+        :param tick_rate: game ticks per second
+        :param send_ticks: ticks between board updates sent to clients
+        """
+
+        self.tick_rate = tick_rate
+        self.send_ticks = send_ticks
+        self.matches = {}
+        self.server = None
+        # writers of open connections by their handler tasks
+        self.connections = {}
+        # statistics of the tick loop
+        self.ticks = 0
+        self.busy_time = 0.0
+        self.skipped_ticks = 0
+
+    async def start(self, host="localhost", port=DEFAULT_PORT):
+        """ Starts listening and the tick loop, port 0 chooses a free port """
+
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self.tick_task = asyncio.create_task(self.run())
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """ Stops the tick loop and closes all connections """
+
+        self.tick_task.cancel()
+        self.server.close()
+        for writer in self.connections.values():
+            writer.close()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def run(self):
+        """ Ticks all matches at the tick rate, a server that falls behind by a second skips ticks """
+
+        next_tick = time.perf_counter()
+        while True:
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            start = time.perf_counter()
+            for name, match in list(self.matches.items()):
+                try:
+                    match.tick()
+                except Exception as error:
+                    # broken match is closed, the other matches go on
+                    print(f"match {name} failed: {error!r}")
+                    match.simulation.winner = NEUTRAL
+                    match.broadcast(ERROR, f"match {name} failed".encode())
+                    for writer in match.writers.values():
+                        writer.close()
+                    del self.matches[name]
+                    continue
+                if match.started and not match.writers:
+                    del self.matches[name]
+            self.busy_time += time.perf_counter() - start
+            self.ticks += 1
+            next_tick += 1 / self.tick_rate
+            if time.perf_counter() - next_tick > 1:
+                self.skipped_ticks += int((time.perf_counter() - next_tick) * self.tick_rate)
+                next_tick = time.perf_counter()
+
+    async def handle(self, reader, writer):
+        """ Serves one client connection """
+
+        self.connections[asyncio.current_task()] = writer
+        match = None
+        player = None
+        try:
+            message_type, payload = await read_message(reader)
+            if message_type != JOIN:
+                raise ValueError("the first message must be JOIN")
+            options = json.loads(payload)
+            name = str(options.get("match", ""))
+            match = self.matches.get(name)
+            if match is not None and match.started and match.simulation.winner is None:
+                send_message(writer, ERROR, f"match {name} has already started".encode())
+                match = None
+                return
+            # finished match is replaced by a new one with the same name
+            if match is None or match.started:
+                match = self.matches[name] = Match(self, name, options)
+            player = match.join(writer)
+
+            while True:
+                message_type, payload = await read_message(reader)
+                if message_type == MOVE:
+                    x1, y1, x2, y2 = MOVE_MESSAGE.unpack(payload)
+                    # malformed moves are errors, moves from cells the player has just lost are dropped
+                    if match.check_move(player, (x1, y1), (x2, y2)):
+                        match.moves.append((player, (x1, y1), (x2, y2)))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except (ValueError, KeyError, struct.error) as error:
+            send_message(writer, ERROR, str(error).encode())
+        finally:
+            if match is not None and player is not None:
+                match.leave(player)
+                if not match.writers and self.matches.get(match.name) is match:
+                    del self.matches[match.name]
+            writer.close()
+            del self.connections[asyncio.current_task()]
+
+
+class Client:
+    """ Connection to the server with a copy of the board that is changed by received updates """
+
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.header = None
+        self.grid_map = None
+        self.simulation = None
+        self.player = None
+        # ticks when the board checksum differed from the server one
+        self.desyncs = 0
+
+    async def connect(self, host="localhost", port=DEFAULT_PORT):
+        """ Opens connection to the server """
+
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+
+    async def join(self, match, **options) -> dict:
+        """
+        Joins the match or creates it with given options and waits until it starts.
+        :param options: map, difficulty, speed, game_mode, players and humans (other players are server bots)
+        :return: START header
+        """
+
+        send_message(self.writer, JOIN, json.dumps(dict(options, match=match)).encode())
+        message_type, payload = await read_message(self.reader)
+        if message_type == ERROR:
+            raise ConnectionError(payload.decode())
+        self.apply_start(payload)
+        return self.header
+
+    def apply_start(self, payload):
+        """ Creates the board from START payload """
+
+        size, = struct.unpack_from("<I", payload)
+        self.header = json.loads(payload[4:4 + size])
+        shape = self.header["shape"]
+        bits = np.frombuffer(payload, dtype=np.uint8, offset=4 + size)
+        self.grid_map = np.unpackbits(bits, count=shape[0] * shape[1]).reshape(shape).astype(bool)
+        self.simulation = Simulation(self.grid_map, [tuple(cell) for cell in self.header["start_cells"]],
+                                     self.header["max_energy"], self.header["wait_ticks"], bots=(),
+                                     seed=self.header["seed"])
+        self.simulation.counter = self.header["counter"]
+        self.player = self.header["player"]
+
+    def apply(self, message_type, payload):
+        """ Applies DELTA or END message to the board """
+
+        if message_type == DELTA:
+            tick, checksum, cells, owner, energy = decode_delta(payload)
+            self.simulation.set_cells(cells, owner, energy)
+            self.simulation.counter = tick
+            if self.simulation.checksum != checksum:
+                self.desyncs += 1
+        elif message_type == END:
+            winner, = END_MESSAGE.unpack(payload)
+            self.simulation.winner = None if winner < 0 else winner
+        elif message_type == ERROR:
+            raise ConnectionError(payload.decode())
+
+    async def receive(self) -> int:
+        """ Reads the next message, applies it and returns its type """
+
+        message_type, payload = await read_message(self.reader)
+        self.apply(message_type, payload)
+        return message_type
+
+    def move(self, source, target):
+        """ Sends move to the server """
+
+        send_message(self.writer, MOVE, MOVE_MESSAGE.pack(*source, *target))
+
+    def close(self):
+        """ Closes the connection """
+
+        if self.writer is not None:
+            self.writer.close()
+
+
+class NetworkClient:
+    """
+    Client that runs its connection on a background thread, for the game loop.
+    Messages are queued by the thread and applied to the board by poll() in the game thread.
+    """
+
+    def __init__(self, host, port, match, **options):
+        self.host = host
+        self.port = port
+        self.match = match
+        self.options = options
+        self.client = Client()
+        self.messages = queue.Queue()
+        self.started = threading.Event()
+        self.error = None
+        self.loop = None
+        self.thread = threading.Thread(target=lambda: asyncio.run(self.run()), daemon=True)
+        # board, map, player id and START header of the match, set when it starts
+        self.simulation = None
+        self.grid_map = None
+        self.player = None
+        self.header = None
+
+    def start(self, timeout=None):
+        """ Connects and waits until the match starts """
+
+        self.thread.start()
+        if not self.started.wait(timeout):
+            raise TimeoutError(f"match {self.match} didn't start")
+        if self.error is not None:
+            raise ConnectionError(self.error)
+        self.simulation = self.client.simulation
+        self.grid_map = self.client.grid_map
+        self.player = self.client.player
+        self.header = self.client.header
+
+    async def run(self):
+        """ Connection loop of the thread """
+
+        self.loop = asyncio.get_running_loop()
+        try:
+            await self.client.connect(self.host, self.port)
+            await self.client.join(self.match, **self.options)
+            self.started.set()
+            while True:
+                self.messages.put(await read_message(self.client.reader))
+        except (OSError, asyncio.IncompleteReadError) as error:
+            self.error = str(error) or "connection closed"
+            # the game ends when the connection is lost
+            self.messages.put((END, END_MESSAGE.pack(-1)))
+        finally:
+            self.started.set()
+            self.client.close()
+
+    def poll(self):
+        """ Applies all received messages to the board """
+
+        while True:
+            try:
+                message_type, payload = self.messages.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self.client.apply(message_type, payload)
+            except ConnectionError as error:
+                self.error = str(error)
+
+    def move(self, source, target):
+        """ Sends move to the server """
+
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.client.move, source, target)
+
+    def close(self):
+        """ Closes the connection """
+
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.client.close)
+
+
+async def serve(args):
+    """ Runs the server until it's stopped """
+
+    server = Server(args.tick_rate, args.send_ticks)
+    port = await server.start(args.host, args.port)
+    print(f"serving on {args.host}:{port}")
+    while True:
+        await asyncio.sleep(10)
+        print(f"{len(server.matches)} matches, {server.busy_time / max(server.ticks, 1) * 1000:.2f} ms per tick")
+
+
+async def play_bot_client(port, match, stop_time, options):
+    """ Headless client that makes random moves until the match ends or the time is over """
+
+    client = Client()
+    await client.connect("localhost", port)
+    await client.join(match, **options)
+    while time.perf_counter() < stop_time and client.simulation.winner is None:
+        try:
+            message_type = await asyncio.wait_for(client.receive(), stop_time - time.perf_counter())
+        except asyncio.TimeoutError:
+            break
+        if message_type == DELTA:
+            move = client.simulation.get_random_move(client.player)
+            if move is not None and client.simulation.energy[move[0]] > 1:
+                client.move(*move)
+    client.close()
+    return client.desyncs
+
+
+async def bench(args):
+    """ Measures server tick time for different numbers of concurrent matches on a loopback server """
+
+    options = {"map": args.map, "difficulty": "Normal", "speed": args.speed, "humans": 2}
+    for count in args.matches:
+        server = Server(args.tick_rate, args.send_ticks)
+        port = await server.start("localhost", 0)
+        stop_time = time.perf_counter() + args.seconds + 5
+        clients = [asyncio.create_task(play_bot_client(port, f"bench-{i}", stop_time, options))
+                   for i in range(count) for side in range(2)]
+        # statistics start when all matches have started
+        while len(server.matches) < count or not all(match.started for match in server.matches.values()):
+            await asyncio.sleep(0.01)
+        ticks, busy_time, start = server.ticks, server.busy_time, time.perf_counter()
+        bytes_sent = sum(match.bytes_sent for match in server.matches.values())
+        await asyncio.sleep(args.seconds)
+        elapsed = time.perf_counter() - start
+        ticks, busy_time = server.ticks - ticks, server.busy_time - busy_time
+        bytes_sent = sum(match.bytes_sent for match in server.matches.values()) - bytes_sent
+        running = len(server.matches)
+        desyncs = sum(await asyncio.gather(*clients))
+        await server.stop()
+
+        busy = busy_time / elapsed
+        print(f"{count:>5} matches ({running} running)  {ticks / elapsed:>5.1f} ticks/s  "
+              f"{busy_time / max(ticks, 1) * 1000:>6.2f} ms/tick  server busy {busy:>6.1%}  "
+              f"~{count / max(busy, 1e-9):>6.0f} matches per core  "
+              f"{bytes_sent / elapsed / max(count, 1) / 1024:>6.1f} KiB/s per match  desyncs {desyncs}")
+
+
+def play(args):
+    """ Joins the match and opens it in the game """
+
+    client = NetworkClient(args.host, args.port, args.match, map=args.map, difficulty=args.difficulty,
+                           speed=args.speed, game_mode=args.game_mode, players=args.players, humans=args.humans)
+    print(f"waiting for match {args.match} on {args.host}:{args.port}")
+    client.start()
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    from base_app import App
+    app = App("Root Wars")
+    app.game.join_match(client)
+    app.run()
+
+
+def main():
+    """ Runs the server, the game client or the benchmark """
+
+    parser = argparse.ArgumentParser(description="Root Wars multiplayer")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run the server")
+    serve_parser.add_argument("--host", default="localhost")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+
+    play_parser = commands.add_parser("play", help="join a match in the game")
+    play_parser.add_argument("--host", default="localhost")
+    play_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    play_parser.add_argument("--match", default="default", help="name of the match to join or create")
+    play_parser.add_argument("--players", type=int, choices=range(2, MAX_PLAYERS + 1), default=2,
+                             help="players of a new match")
+    play_parser.add_argument("--humans", type=int, choices=range(1, MAX_PLAYERS + 1), default=2,
+                             help="human players of a new match, the others are played by server bots")
+    play_parser.add_argument("--map", default="Two-Way", help="map name or generated:<size>")
+    play_parser.add_argument("--difficulty", choices=list(DIFFICULTY_WAIT_TICKS), default="Normal")
+    play_parser.add_argument("--speed", choices=list(SPEED_FACTORS), default="Normal")
+    play_parser.add_argument("--game-mode", choices=["Classic", "Fast"], default="Classic")
+
+    bench_parser = commands.add_parser("bench", help="measure concurrent matches on a loopback server")
+    bench_parser.add_argument("--matches", type=int, nargs="+", default=[1, 10, 50, 100])
+    bench_parser.add_argument("--seconds", type=float, default=10, help="measured time of every run")
+    bench_parser.add_argument("--map", default="Two-Way", help="map name or generated:<size>")
+    bench_parser.add_argument("--speed", choices=list(SPEED_FACTORS), default="Super Fast")
+
+    for command_parser in (serve_parser, bench_parser):
+        command_parser.add_argument("--tick-rate", type=int, default=60)
+        command_parser.add_argument("--send-ticks", type=int, default=3, help="ticks between board updates")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        asyncio.run(serve(args))
+    elif args.command == "bench":
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        asyncio.run(bench(args))
+    else:
+        play(args)
+
+
+if __name__ == "__main__":
+    main()
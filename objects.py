@@ -4,7 +4,11 @@ This file contains all game objects classes .
 """
 
 import pygame.draw
+import pygame.surfarray
+from collections import OrderedDict
+import numpy as np
 from functions import *
+from spatial import *
 
 
 def rotate(image, pos, origin_pos, angle):
@@ -31,6 +35,171 @@ def rotate(image, pos, origin_pos, angle):
     return rotated_image, [origin[0] + 25, origin[1] + 25]
 
 
+class LRUCache:
+    """ Size-bounded cache that drops the least recently used values first """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """ Returns cached value for given key or None """
+
+        value = self.values.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.values.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """ Caches value for given key, dropping the least recently used values if cache is full """
+
+        self.values[key] = value
+        self.values.move_to_end(key)
+        while len(self.values) > self.max_size:
+            self.values.popitem(last=False)
+
+    def pop(self, key):
+        """ Drops cached value for given key if it exists """
+
+        self.values.pop(key, None)
+
+    def clear(self):
+        """ Drops all values and resets counters """
+
+        self.values.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# hexagon surfaces shared by all Hexagon objects
+sprite_cache = LRUCache(256)
+# hexagon surfaces of zoom levels, like mipmaps they are scaled once from the full size surfaces
+scaled_sprite_cache = LRUCache(2048)
+# fonts and rendered text surfaces shared by all UI objects
+font_registry = {}
+text_cache = LRUCache(512)
+
+
+def get_font(font_name, font_size, bold=False, italic=False):
+    """ Returns shared pygame font, loading it only the first time it's requested """
+
+    key = (font_name, font_size, bold, italic)
+    font = font_registry.get(key)
+    if font is None:
+        font = pygame.font.SysFont(font_name, font_size, bold, italic)
+        font_registry[key] = font
+    return font
+
+
+def get_scaled_sprite(key, sprite, zoom) -> tuple:
+    """ Returns surfaces of the sprite scaled by the zoom factor, scaled surfaces are cached for every zoom level """
+
+    if zoom == 1:
+        return sprite
+    scaled = scaled_sprite_cache.get((key, zoom))
+    if scaled is None:
+        scaled = []
+        for surface in sprite:
+            size = [max(1, round(size * zoom)) for size in surface.get_size()]
+            if surface.get_colorkey() is None:
+                scaled.append(pygame.transform.smoothscale(surface, size))
+            else:
+                # smooth scaling would blend the colorkey into edge pixels and leave a dark fringe
+                scaled.append(pygame.transform.scale(surface, size))
+                scaled[-1].set_colorkey(surface.get_colorkey())
+        scaled = tuple(scaled)
+        scaled_sprite_cache.put((key, zoom), scaled)
+    return scaled
+
+
+def prescale_sprite(key, sprite, zooms):
+    """ Scales the sprite for all given zoom levels, so zooming doesn't scale sprites while the frame is drawn """
+
+    for zoom in zooms:
+        get_scaled_sprite(key, sprite, zoom)
+
+
+def render_text(font, text, smooth, foreground, background=None):
+    """ Returns shared surface with rendered text, rendering it only if it's not cached """
+
+    key = (font, text, smooth, tuple(foreground), tuple(background) if background else None)
+    surface = text_cache.get(key)
+    if surface is None:
+        surface = font.render(text, smooth, foreground, background)
+        text_cache.put(key, surface)
+    return surface
+
+
+class DirtyRenderer:
+    """
+    Renderer that can redraw only changed regions of the screen.
+    When disabled or invalidated, the whole screen is redrawn.
+    """
+
+    max_rects = 64
+
+    def __init__(self, app, enabled=False):
+        self.app = app
+        self.enabled = enabled
+        self.full = True
+        self.pending = []
+        self.rects = None
+
+    def invalidate(self):
+        """ Makes the next frame redraw the whole screen """
+
+        self.full = True
+
+    def mark(self, rect):
+        """ Remembers that given [x, y, width, height] screen rectangle must be redrawn on the next frame """
+
+        if self.enabled and not self.full:
+            self.pending.append(pygame.Rect(rect))
+            if len(self.pending) > self.max_rects:
+                self.full = True
+
+    def draw(self, draw_function):
+        """
+        Redraws changed regions of the screen.
+        :param draw_function: function that draws everything that intersects given screen rectangle
+        """
+
+        screen = self.app.DISPLAY.get_rect()
+        if not self.enabled or self.full:
+            draw_function(screen)
+            self.rects = None
+        else:
+            self.rects = []
+            for rect in self.pending:
+                rect = rect.clip(screen)
+                if not rect.width or not rect.height:
+                    continue
+                i = rect.collidelist(self.rects)
+                if i == -1:
+                    self.rects.append(rect)
+                else:
+                    self.rects[i] = self.rects[i].union(rect)
+            for rect in self.rects:
+                self.app.DISPLAY.set_clip(rect)
+                draw_function(rect)
+            self.app.DISPLAY.set_clip(None)
+        self.full = False
+        self.pending = []
+
+    def present(self):
+        """ Pushes regions redrawn on this frame to the screen """
+
+        if self.rects is None:
+            pygame.display.update()
+        elif self.rects:
+            pygame.display.update(self.rects)
+
+
 class Pos:
     """ Basic class for interpreting something that has position """
 
@@ -157,7 +326,8 @@ class Label(Pos):
         self.foreground = foreground
         self.background = background
 
-        self.font = pygame.font.SysFont(font_name, font_size, bold, italic)
+        self.font = get_font(font_name, font_size, bold, italic)
+        self.rendered = None
         self.update_text(self.text, self.smooth, self.foreground, self.background)
 
     def update(self):
@@ -166,7 +336,10 @@ class Label(Pos):
         self.game.app.DISPLAY.blit(self.surface, self.pos)
 
     def update_text(self, text, smooth=None, foreground=None, background=None):
-        """ Updates text, smooth, foreground and background values of label and recreates surface of label """
+        """
+        Updates text, smooth, foreground and background values of label and recreates surface of label.
+        Surface is left as it is if none of the values have changed.
+        """
 
         self.text = str(text)
         if smooth:
@@ -175,8 +348,15 @@ class Label(Pos):
             self.foreground = foreground
         if background:
             self.background = background
-        self.surface = self.font.render(self.text, self.smooth, self.foreground, self.background)
+        rendered = (self.text, self.smooth, self.foreground, self.background)
+        if rendered == self.rendered:
+            return
+        if self.rendered is not None:
+            self.game.app.renderer.mark([self.pos, self.size])
+        self.rendered = rendered
+        self.surface = render_text(self.font, self.text, self.smooth, self.foreground, self.background)
         self.size = self.surface.get_size()
+        self.game.app.renderer.mark([self.pos, self.size])
 
     def center_x(self, y=0):
         """ Places label at the center of game app screen width """
@@ -339,6 +519,7 @@ class ColorOptionButton(OptionButton):
     def next_option(self):
         """ Selects next option to display on color option button """
 
+        self.game.app.renderer.mark([[self.pos[0] + self.size[0], self.pos[1]], self.color_rect_size])
         self.current_option += 1
         if self.current_option > len(self.options) - 1:
             self.current_option = 0
@@ -363,7 +544,8 @@ class Text(Label):
 
         self.text_list = self.text.split("\n")
         self.lines = len(self.text_list)
-        self.surface_list = [self.font.render(i, self.smooth, self.foreground, self.background) for i in self.text_list]
+        self.surface_list = [render_text(self.font, i, self.smooth, self.foreground, self.background)
+                             for i in self.text_list]
         self.pos_list = [[self.pos[0], self.pos[1] + i * self.line_height] for i in range(len(self.text_list))]
         self.size_list = [self.surface_list[i].get_size() for i in range(self.lines)]
 
@@ -424,32 +606,61 @@ class Hexagon(Label):
             self.hexagon_size = [100, 100]
         else:
             self.hexagon_size = [hexagon_size[0] // 2, hexagon_size[1] // 2]
-        self.text_surface = self.font.render(self.text, self.smooth, self.foreground, self.background)
 
         # game variables
         self.energy = energy
+        self.owner = 0
+        self.layer = None
+        self.dirty = False
+        # surfaces of the last zoom level Hexagon was shown at
+        self.zoomed_sprite = None
 
         self.draw_hexagon()
 
-    def draw_hexagon(self):
-        """ Draw hexagon on its surface """
-
-        self.text_surface = self.font.render(str(int(self.energy)), self.smooth, self.foreground, self.background)
-        self.surface = pygame.Surface(self.surface_size)
-        self.surface.set_colorkey((0, 0, 0))
+    @classmethod
+    def get_points(cls, hexagon_size, width):
+        """ Returns corner points of the hexagon with given half size and outline width on its surface """
 
-        self.pos_list = [[0, math.cos(deg_to_rad(60)) * self.hexagon_size[1] * 2.9 + self.width]]
+        points = [[0, math.cos(deg_to_rad(60)) * hexagon_size[1] * 2.9 + width]]
         for i in range(1, 6):
             p = [
-                self.pos_list[i - 1][0] + round(math.sin(deg_to_rad(i * 60)) * self.hexagon_size[0]),
-                self.pos_list[i - 1][1] + round(math.cos(deg_to_rad(i * 60)) * self.hexagon_size[1])
+                points[i - 1][0] + round(math.sin(deg_to_rad(i * 60)) * hexagon_size[0]),
+                points[i - 1][1] + round(math.cos(deg_to_rad(i * 60)) * hexagon_size[1])
             ]
-            self.pos_list.append(p)
-        for i in self.pos_list:
-            i[0] = self.surface_size[0] - i[0] - self.width
-            i[1] = self.surface_size[1] - i[1]
+            points.append(p)
+        for i in points:
+            i[0] = cls.surface_size[0] - i[0] - width
+            i[1] = cls.surface_size[1] - i[1]
+        return points
+
+    def draw_hexagon(self):
+        """ Takes hexagon surfaces for current state from the sprite cache, drawing them if they are not cached """
+
+        self.pos_list = self.get_points(self.hexagon_size, self.width)
+
+        key = (tuple(self.color), tuple(self.outline_color), self.energy, tuple(self.hexagon_size), self.width,
+               self.font_name, self.font_size, self.bold, self.italic, self.smooth, tuple(self.foreground),
+               tuple(self.background) if self.background else None)
+        sprite = sprite_cache.get(key)
+        if sprite is None:
+            sprite = self.render_sprite()
+            sprite_cache.put(key, sprite)
+            prescale_sprite(key, sprite, self.game.get_zoom_levels())
+        self.sprite_key = key
+        self.surface, self.text_surface = sprite
+        self.zoomed_sprite = None
+        if self.layer is not None:
+            self.layer.cell_changed(self)
+            self.game.app.renderer.mark(self.get_screen_rect())
+
+    def render_sprite(self):
+        """ Draws hexagon and energy text surfaces for current state """
+
+        surface = pygame.Surface(self.surface_size)
+        surface.set_colorkey((0, 0, 0), pygame.RLEACCEL)
+
         if self.energy > 0:
-            pygame.draw.lines(self.surface, self.outline_color, True, self.pos_list, self.width)
+            pygame.draw.lines(surface, self.outline_color, True, self.pos_list, self.width)
             for i in range(int(self.energy)):
                 energy_pos_list = []
                 for j in self.pos_list:
@@ -465,68 +676,342 @@ class Hexagon(Label):
                 color[1] = 255 if color[1] > 255 else color[1]
                 color[2] = 255 if color[2] > 255 else color[2]
 
-                pygame.draw.polygon(self.surface, color, energy_pos_list)
+                pygame.draw.polygon(surface, color, energy_pos_list)
                 if i % 5 == 0:
-                    pygame.draw.lines(self.surface, self.color, True, energy_pos_list, self.width)
+                    pygame.draw.lines(surface, self.color, True, energy_pos_list, self.width)
         else:
-            pygame.draw.polygon(self.surface, self.color, self.pos_list)
-            pygame.draw.lines(self.surface, self.outline_color, True, self.pos_list, self.width)
+            pygame.draw.polygon(surface, self.color, self.pos_list)
+            pygame.draw.lines(surface, self.outline_color, True, self.pos_list, self.width)
 
-        self.text_surface = self.font.render(str(self.energy), self.smooth, self.foreground, self.background)
+        text_surface = render_text(self.font, str(self.energy), self.smooth, self.foreground, self.background)
+        return surface, text_surface
+
+    def get_sprite(self) -> tuple:
+        """ Returns Hexagon and energy text surfaces for the zoom level of the game """
+
+        zoom = self.game.zoom
+        if zoom == 1:
+            return self.surface, self.text_surface
+        if self.zoomed_sprite is None or self.zoomed_sprite[0] != zoom:
+            self.zoomed_sprite = [zoom, get_scaled_sprite(self.sprite_key, (self.surface, self.text_surface), zoom)]
+        return self.zoomed_sprite[1]
 
     def update(self):
         """ Shows the surface of Hexagon on a game app display """
 
-        self.game.app.DISPLAY.blit(self.surface, [self.pos[0] + self.game.cords[0], self.pos[1] + self.game.cords[1]])
+        zoom = self.game.zoom
+        surface, text_surface = self.get_sprite()
+        pos = [self.pos[0] * zoom + self.game.cords[0], self.pos[1] * zoom + self.game.cords[1]]
+        self.game.app.DISPLAY.blit(surface, pos)
         if self.energy > 0:
-            self.game.app.DISPLAY.blit(self.text_surface, [
-                self.pos[0] + self.game.cords[0] + self.surface_size[0] - 50 - self.energy * self.height_scale -
-                self.text_surface.get_size()[0] / 2,
-                self.pos[1] + self.game.cords[1] + self.surface_size[0] - 90 - self.energy * self.height_scale])
+            self.game.app.DISPLAY.blit(text_surface, [
+                pos[0] + (self.surface_size[0] - 50 - self.energy * self.height_scale) * zoom -
+                text_surface.get_size()[0] / 2,
+                pos[1] + (self.surface_size[0] - 90 - self.energy * self.height_scale) * zoom])
 
-    def zoom(self, size, pos):
-        """ Zooms Hexagon size and position """
+    def is_static(self):
+        """ Checks if Hexagon is an empty grid hexagon that can be baked into the static map layer """
 
-        self.pos = pos
-        self.hexagon_size = [size[0] // 2, size[1] // 2]
-        self.draw_hexagon()
+        return self.energy == 0 and tuple(self.color) == tuple(self.game.grid_hex_color)
+
+    def get_rect(self):
+        """ Returns [x, y, width, height] rectangle that Hexagon surface occupies in the world """
+
+        return [self.pos[0], self.pos[1], self.surface_size[0], self.surface_size[1]]
+
+    def get_screen_rect(self):
+        """ Returns [x, y, width, height] rectangle that Hexagon surface occupies on the screen """
+
+        zoom = self.game.zoom
+        return [self.pos[0] * zoom + self.game.cords[0], self.pos[1] * zoom + self.game.cords[1],
+                self.surface_size[0] * zoom, self.surface_size[1] * zoom]
 
     def set_color(self, color):
-        """ Sets Hexagon color """
+        """ Sets Hexagon color, Hexagon will be redrawn when it's visible """
 
-        self.color = color
-        self.draw_hexagon()
+        if tuple(color) != tuple(self.color):
+            self.color = color
+            self.dirty = True
 
     def set_outline_color(self, color):
-        """ Sets Hexagon outline color """
+        """ Sets Hexagon outline color, Hexagon will be redrawn when it's visible """
 
-        self.outline_color = color
-        self.draw_hexagon()
+        if tuple(color) != tuple(self.outline_color):
+            self.outline_color = color
+            self.dirty = True
 
     def set_energy(self, energy):
-        """ Sets Hexagon energy """
+        """ Sets Hexagon energy, Hexagon will be redrawn when it's visible """
 
-        self.energy = energy
-        self.draw_hexagon()
+        if energy != self.energy:
+            self.energy = energy
+            self.dirty = True
+
+    def redraw(self):
+        """ Redraws Hexagon if its state has changed since the last redraw """
+
+        if self.dirty:
+            self.dirty = False
+            self.draw_hexagon()
 
 
 class Line(Vector):
     """ Line class for the Root Wars grid map. """
 
-    def __init__(self, game, pos1=None, pos2=None, color=(255, 255, 255), width=5):
+    def __init__(self, game, pos1=None, pos2=None, color=(255, 255, 255), width=5, back=None):
+        """
+        :param back: [pos1, pos2] of the stroke drawn from the other end of the Line, grid lines are drawn
+                     from the corners of both hexagons they connect
+        """
+
         self.game = game
 
         super().__init__(pos1, pos2)
         self.color = color
         self.width = width
+        self.strokes = [[self.pos1, self.pos2]] + ([back] if back is not None else [])
+
+    def get_rect(self):
+        """ Returns [x, y, width, height] rectangle that Line occupies in the world """
+
+        xs = [pos[0] for stroke in self.strokes for pos in stroke]
+        ys = [pos[1] for stroke in self.strokes for pos in stroke]
+        return [min(xs) - self.width, min(ys) - self.width, max(xs) - min(xs) + self.width * 2,
+                max(ys) - min(ys) + self.width * 2]
+
+    def draw(self, surface, zoom, offset):
+        """ Draws the Line on the surface scaled by the zoom and moved by the offset """
+
+        width = max(1, round(self.width * zoom))
+        for pos1, pos2 in self.strokes:
+            pygame.draw.line(surface, self.color, [pos1[0] * zoom + offset[0], pos1[1] * zoom + offset[1]],
+                             [pos2[0] * zoom + offset[0], pos2[1] * zoom + offset[1]], width)
 
     def update(self):
         """ Draws the Line on game app display """
 
-        pygame.draw.line(self.game.app.DISPLAY, self.color,
-                         [self.pos1[0] + self.game.cords[0], self.pos1[1] + self.game.cords[1]],
-                         [self.pos2[0] + self.game.cords[0], self.pos2[1] + self.game.cords[1]],
-                         self.width)
+        self.draw(self.game.app.DISPLAY, self.game.zoom, self.game.cords)
+
+
+class TileLayer:
+    """
+    Static layer of the Root Wars grid map.
+    Grid lines and empty hexagons are baked into square tile surfaces,
+    so the camera only blits visible tiles instead of drawing every object.
+    Tiles are baked for every zoom level of the game, their keys are chunks of the zoomed world,
+    so zooming back to a level shows tiles that were already baked.
+    """
+
+    tile_size = 512
+    max_tiles = 64
+
+    def __init__(self, game, lines, hexagons):
+        self.game = game
+
+        self.line_grid = SpatialGrid(self.tile_size)
+        for obj in lines:
+            self.line_grid.insert(obj, obj.get_rect())
+        self.hexagon_grid = SpatialGrid(self.tile_size)
+        for obj in hexagons:
+            self.hexagon_grid.insert(obj, obj.get_rect())
+
+        self.tiles = LRUCache(self.max_tiles)
+        # zoom levels that tiles were baked for
+        self.zooms = set()
+        self.static = set()
+        for obj in hexagons:
+            obj.layer = self
+            if obj.is_static():
+                self.static.add(obj)
+
+    def cell_changed(self, hexagon):
+        """ Re-bakes tiles under the hexagon if it became static or stopped being static """
+
+        static = hexagon.is_static()
+        if static != (hexagon in self.static):
+            if static:
+                self.static.add(hexagon)
+            else:
+                self.static.discard(hexagon)
+            rect = hexagon.get_rect()
+            for zoom in self.zooms:
+                for key in self.line_grid.get_chunks([rect[0] * zoom, rect[1] * zoom, rect[2] * zoom,
+                                                      rect[3] * zoom]):
+                    self.tiles.pop((zoom,) + key)
+
+    def get_world_rect(self, key) -> list:
+        """ Returns rectangle of the full size world that the tile with given key shows """
+
+        zoom = self.game.zoom
+        return [key[0] * self.tile_size / zoom, key[1] * self.tile_size / zoom,
+                (self.tile_size - 1) / zoom, (self.tile_size - 1) / zoom]
+
+    def bake(self, key):
+        """ Draws lines and static hexagons of the tile with given key on a new tile surface """
+
+        surface = pygame.Surface([self.tile_size, self.tile_size])
+        surface.set_colorkey((0, 0, 0), pygame.RLEACCEL)
+        zoom = self.game.zoom
+        self.zooms.add(zoom)
+        origin = [key[0] * self.tile_size, key[1] * self.tile_size]
+        rect = self.get_world_rect(key)
+        for obj in self.line_grid.query(rect):
+            obj.draw(surface, zoom, [-origin[0], -origin[1]])
+        for obj in self.hexagon_grid.query(rect):
+            if obj in self.static:
+                surface.blit(obj.get_sprite()[0], [obj.pos[0] * zoom - origin[0], obj.pos[1] * zoom - origin[1]])
+        return surface
+
+    def update(self, rect):
+        """
+        Shows tiles that intersect given rectangle of the zoomed world on a game app display,
+        baking tiles that are not baked
+        """
+
+        for key in self.line_grid.get_chunks(rect):
+            chunks = self.line_grid.get_chunks(self.get_world_rect(key))
+            if not any(chunk in self.line_grid.chunks or chunk in self.hexagon_grid.chunks for chunk in chunks):
+                continue
+            tile = self.tiles.get((self.game.zoom,) + key)
+            if tile is None:
+                tile = self.bake(key)
+                self.tiles.put((self.game.zoom,) + key, tile)
+            self.game.app.DISPLAY.blit(tile, [key[0] * self.tile_size + self.game.cords[0],
+                                              key[1] * self.tile_size + self.game.cords[1]])
+
+
+class Minimap(Surface):
+    """
+    Minimap of the Root Wars board.
+    Every cell is a block of pixels in the color of its owner, hexagon rows are shifted by half a block
+    like on the map. Blocks are written with pygame.surfarray, so only changed cells are patched.
+    """
+
+    background = (10, 10, 10)
+    neutral_color = (70, 70, 70)
+    viewport_color = (255, 255, 255)
+
+    def __init__(self, game, cells, max_size=None, margin=20, alpha=220):
+        """
+        :param cells: grid map positions of all cells in board order
+        :param max_size: max width and height of the minimap in pixels
+        """
+
+        if max_size is None:
+            max_size = [300, 300]
+        cells = np.asarray(cells).reshape(-1, 2)
+        # a block is two columns wide, blocks of odd rows are shifted by one column like hexagons on the map
+        columns = cells[:, 0] // 3 * 2 + cells[:, 1] % 2
+        shape = [int(columns.max()) + 2, int(cells[:, 1].max()) + 1] if len(cells) else [2, 1]
+        # hexagons in a row are further from each other than hexagon rows, so columns are wider than rows are tall
+        scale = max(1.0, min(max_size[0] / (shape[0] * pow(3, 0.5)), max_size[1] / shape[1]))
+        self.column_width = max(1, round(scale * pow(3, 0.5)))
+        self.block_size = [self.column_width * 2, max(1, int(scale))]
+        self.cell_index = {tuple(cell): i for i, cell in enumerate(cells.tolist())}
+        self.block_pos = np.stack([columns * self.column_width, cells[:, 1] * self.block_size[1]], axis=1)
+
+        size = [shape[0] * self.column_width, shape[1] * self.block_size[1]]
+        pos = [game.app.WIDTH - size[0] - margin, game.app.HEIGHT - size[1] - margin]
+        super().__init__(game, pos, size, alpha)
+        self.surface.fill(self.background)
+
+    def patch(self, cells, owners, colors):
+        """
+        Fills blocks of given cells with colors of their owners.
+        :param owners: owner of every cell
+        :param colors: dictionary with colors of players, other owners get neutral color
+        """
+
+        if not len(cells):
+            return
+        palette = np.array([colors.get(owner, self.neutral_color) for owner in range(max(owners) + 1)])
+        blocks = self.block_pos[[self.cell_index[tuple(cell)] for cell in cells]]
+        x = blocks[:, 0, None, None] + np.arange(self.block_size[0])[None, :, None]
+        y = blocks[:, 1, None, None] + np.arange(self.block_size[1])[None, None, :]
+        pixels = pygame.surfarray.pixels3d(self.surface)
+        pixels[x, y] = palette[owners][:, None, None, :]
+        del pixels
+        self.game.app.renderer.mark([self.pos, self.size])
+
+    def world_to_minimap(self, pos) -> list:
+        """ Returns minimap position of given world position of a hexagon """
+
+        width = pow(3, 0.5) * self.game.hexagon_size
+        return [self.pos[0] + ((pos[0] / width - 0.5) * 2 / 3 + 1) * self.column_width,
+                self.pos[1] + (pos[1] / (1.5 * self.game.hexagon_size) + 0.5) * self.block_size[1]]
+
+    def minimap_to_world(self, pos) -> list:
+        """ Returns world position of a hexagon for given minimap position """
+
+        width = pow(3, 0.5) * self.game.hexagon_size
+        return [(((pos[0] - self.pos[0]) / self.column_width - 1) * 3 / 2 + 0.5) * width,
+                ((pos[1] - self.pos[1]) / self.block_size[1] - 0.5) * 1.5 * self.game.hexagon_size]
+
+    def contains(self, pos) -> bool:
+        """ Checks if given screen position is on the minimap """
+
+        return pygame.Rect(self.pos, self.size).collidepoint(pos)
+
+    def update(self):
+        """ Shows the minimap with the part of the map that is on the screen """
+
+        super().update()
+        top_left = self.world_to_minimap(self.game.screen_to_world([0, 0]))
+        bottom_right = self.world_to_minimap(self.game.screen_to_world([self.game.app.WIDTH, self.game.app.HEIGHT]))
+        viewport = pygame.Rect(top_left, [bottom_right[0] - top_left[0], bottom_right[1] - top_left[1]])
+        clip = self.game.app.DISPLAY.get_clip()
+        self.game.app.DISPLAY.set_clip(clip.clip([self.pos, self.size]))
+        pygame.draw.rect(self.game.app.DISPLAY, self.viewport_color, viewport, 1)
+        self.game.app.DISPLAY.set_clip(clip)
+
+
+class ProfilerOverlay(Surface):
+    """ Shows rolling p50/p99 times of profiler phases and the frame time graph """
+
+    line_height = 22
+    graph_height = 90
+
+    def __init__(self, game, profiler, pos=None, size=None, refresh_frames=15):
+        if size is None:
+            size = [420, 300]
+        super().__init__(game, pos, size, alpha=220)
+        self.profiler = profiler
+        self.refresh_frames = refresh_frames
+        self.font = get_font("Courier", 20, True)
+        self.counter = 0
+        self.draw_overlay()
+
+    def draw_overlay(self):
+        """ Draws profiler statistics and frame time graph on the surface """
+
+        self.surface.fill((15, 15, 15))
+        rows = [["phase", "p50 ms", "p99 ms"]]
+        for name, (p50, p99) in self.profiler.get_stats().items():
+            rows.append([name, f"{p50:.2f}", f"{p99:.2f}"])
+        for i, row in enumerate(rows):
+            for x, text in zip([10, 170, 290], row):
+                self.surface.blit(render_text(self.font, text, True, (0, 255, 0)), [x, 5 + i * self.line_height])
+
+        # frame time graph, the line shows time of one frame at max fps
+        graph_top = self.size[1] - self.graph_height - 5
+        budget = 1 / self.game.app.MAX_FPS
+        frames = self.profiler.get_history(self.profiler.frame_times)[-(self.size[0] - 20):]
+        for x, frame_time in enumerate(frames):
+            height = min(frame_time / (budget * 2), 1) * self.graph_height
+            color = (0, 200, 0) if frame_time <= budget * 1.1 else (255, 60, 0)
+            pygame.draw.line(self.surface, color, [10 + x, graph_top + self.graph_height],
+                             [10 + x, graph_top + self.graph_height - height])
+        pygame.draw.line(self.surface, (200, 200, 200), [10, graph_top + self.graph_height / 2],
+                         [self.size[0] - 10, graph_top + self.graph_height / 2])
+
+    def refresh(self):
+        """ Redraws the overlay every refresh_frames frames """
+
+        self.counter += 1
+        if self.counter >= self.refresh_frames:
+            self.counter = 0
+            self.draw_overlay()
+            self.game.app.renderer.mark([self.pos, self.size])
 
 
 class AnimatedRing(Surface):
@@ -0,0 +1,83 @@
+"""
+Frame profiler.
+Records how long every phase of the game loop takes on each frame in ring buffers,
+computes rolling statistics and dumps recorded frames to a file for offline analysis.
+"""
+
+import json
+import time
+import numpy as np
+
+PHASES = ["events", "simulation", "bot", "lines", "hexagons", "redraw", "display"]
+
+
+class Profiler:
+    """ Per-phase frame profiler with ring buffers of the last frames """
+
+    def __init__(self, frames=300):
+        self.frames = frames
+        self.times = {phase: np.zeros(frames) for phase in PHASES}
+        self.frame_times = np.zeros(frames)
+        self.index = 0
+        self.count = 0
+
+        self.current = {phase: 0.0 for phase in PHASES}
+        self.started = {}
+        self.frame_start = time.perf_counter()
+
+    def start(self, phase):
+        """ Starts measuring given phase """
+
+        self.started[phase] = time.perf_counter()
+
+    def stop(self, phase):
+        """ Stops measuring given phase and adds its time to the current frame """
+
+        self.current[phase] += time.perf_counter() - self.started.pop(phase)
+
+    def add(self, phase, seconds):
+        """ Adds time measured outside of the profiler to given phase of the current frame """
+
+        self.current[phase] += seconds
+
+    def next_frame(self):
+        """ Saves times of the current frame to ring buffers and starts a new frame """
+
+        now = time.perf_counter()
+        for phase in PHASES:
+            self.times[phase][self.index] = self.current[phase]
+            self.current[phase] = 0.0
+        self.frame_times[self.index] = now - self.frame_start
+        self.frame_start = now
+        self.index = (self.index + 1) % self.frames
+        self.count = min(self.count + 1, self.frames)
+
+    def get_history(self, values) -> np.ndarray:
+        """ Returns recorded values of the ring buffer from the oldest to the newest frame """
+
+        if self.count < self.frames:
+            return values[:self.count]
+        return np.roll(values, -self.index)
+
+    def get_stats(self) -> dict:
+        """ Returns rolling p50 and p99 in milliseconds for every phase and for the whole frame """
+
+        stats = {}
+        if not self.count:
+            return stats
+        for name, values in list(self.times.items()) + [("frame", self.frame_times)]:
+            history = self.get_history(values) * 1000
+            stats[name] = [float(np.percentile(history, 50)), float(np.percentile(history, 99))]
+        return stats
+
+    def dump(self, path):
+        """ Writes recorded frames and their statistics to a json file """
+
+        data = {
+            "phases": PHASES,
+            "stats": self.get_stats(),
+            "frames": self.get_history(self.frame_times).tolist(),
+            "times": {phase: self.get_history(values).tolist() for phase, values in self.times.items()},
+        }
+        with open(path, "w") as file:
+            json.dump(data, file, indent=1)
@@ -0,0 +1,267 @@
+"""
+Match replays.
+Replay file starts with a header (settings, seeds and the grid map) and continues with an append-only
+list of binary records: player selections, grows and attacks, bot decisions and keyframes of the
+whole board. Playback jumps to any tick by restoring the nearest keyframe and playing recorded
+actions from there, skipping ticks when nothing happens.
+
+Usage:
+    python replay.py replays/game.rwr --speed 4 --tick 3600
+    python replay.py replays/game.rwr --verify
+"""
+
+import bisect
+import json
+import struct
+import zlib
+import numpy as np
+from simulation import *
+
+REPLAY_MAGIC = b"RWRP"
+REPLAY_VERSION = 2
+# record types
+SELECT = 0
+GROW = 1
+ATTACK = 2
+BOT_MOVE = 3
+KEYFRAME = 4
+
+HEADER = struct.Struct("<4sHII")  # magic, version, json size, grid map size
+RECORD = struct.Struct("<BI")  # record type, tick
+SELECT_RECORD = struct.Struct("<BHH")  # player, cell
+MOVE_RECORD = struct.Struct("<BHHHH")  # player, source cell, target cell
+KEYFRAME_RECORD = struct.Struct("<bI")  # winner, size of compressed board
+# cell of the bot decision to wait
+NO_CELL = 0xFFFF
+
+
+class ReplayWriter:
+    """ Writes actions of the match to a replay file while it's played """
+
+    def __init__(self, path, simulation, keyframe_ticks=600, **info):
+        """
+        :param simulation: match to record, its recorder is set to this writer
+        :param keyframe_ticks: ticks between keyframes
+        :param info: values saved in the header, like map name and seeds
+        """
+
+        self.keyframe_ticks = keyframe_ticks
+        header = dict(info)
+        header.update({
+            "start_cells": [list(simulation.roots[player]) for player in sorted(simulation.roots)],
+            "max_energy": simulation.max_energy,
+            "wait_ticks": [simulation.wait_ticks[player] for player in sorted(simulation.roots)],
+            "bots": sorted(int(player) for player in simulation.bots),
+            "shape": list(simulation.passable.shape),
+        })
+        header = json.dumps(header).encode()
+        grid_map = np.packbits(np.asarray(simulation.grid_map, dtype=bool)).tobytes()
+
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, len(header), len(grid_map)) + header + grid_map)
+        self.cells = tuple(np.array(simulation.cells).reshape(-1, 2).T)
+        self.keyframe(simulation)
+        simulation.recorder = self
+
+    def select(self, simulation, player, cell):
+        """ Records selection of the player cell """
+
+        self.file.write(RECORD.pack(SELECT, simulation.counter) + SELECT_RECORD.pack(player, *cell))
+
+    def move(self, simulation, player, source, target, attack):
+        """ Records grow or attack made by the player """
+
+        self.file.write(RECORD.pack(ATTACK if attack else GROW, simulation.counter) +
+                        MOVE_RECORD.pack(player, *source, *target))
+
+    def bot_move(self, simulation, player, move):
+        """ Records move chosen by the bot, None is the decision to wait """
+
+        source, target = move if move is not None else [(NO_CELL, NO_CELL)] * 2
+        self.file.write(RECORD.pack(BOT_MOVE, simulation.counter) + MOVE_RECORD.pack(player, *source, *target))
+
+    def keyframe(self, simulation):
+        """ Records owners and energy of all cells """
+
+        board = zlib.compress(simulation.owner[self.cells].astype(np.int8).tobytes() +
+                              simulation.energy[self.cells].astype(np.int16).tobytes())
+        winner = -1 if simulation.winner is None else simulation.winner
+        self.file.write(RECORD.pack(KEYFRAME, simulation.counter) + KEYFRAME_RECORD.pack(winner, len(board)) + board)
+        self.file.flush()
+
+    def tick(self, simulation):
+        """ Called by the simulation after every tick, records keyframes """
+
+        if simulation.counter % self.keyframe_ticks == 0:
+            self.keyframe(simulation)
+
+    def close(self, simulation):
+        """ Records the last keyframe, closes the file and stops recording the simulation """
+
+        if not self.file.closed:
+            self.keyframe(simulation)
+            self.file.close()
+        simulation.recorder = None
+
+
+class ReplayBot:
+    """ Bot that repeats decisions of the recorded bot """
+
+    def __init__(self, replay):
+        self.replay = replay
+
+    def get_move(self, simulation, player):
+        """ Returns the move the bot made on this tick """
+
+        return self.replay.bot_moves.get((simulation.counter, player))
+
+
+class Replay:
+    """ Recorded match that can be played from any tick """
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            data = file.read()
+        magic, version, header_size, grid_map_size = HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"{path} is not a replay of version {REPLAY_VERSION}")
+        offset = HEADER.size
+        self.header = json.loads(data[offset:offset + header_size])
+        offset += header_size
+        shape = self.header["shape"]
+        bits = np.frombuffer(data, dtype=np.uint8, count=grid_map_size, offset=offset)
+        self.grid_map = np.unpackbits(bits, count=shape[0] * shape[1]).reshape(shape).astype(bool)
+        offset += grid_map_size
+
+        self.cells = tuple(np.array(get_mask_cells(get_passable_mask(self.grid_map))).reshape(-1, 2).T)
+        # player actions by tick, bot decisions by tick and player, keyframes sorted by tick
+        self.actions = {}
+        self.bot_moves = {}
+        self.keyframes = []
+        self.last_tick = 0
+        # the last record can be cut if the game was closed while it was written
+        while offset + RECORD.size <= len(data):
+            record_type, tick = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            if record_type == SELECT:
+                if offset + SELECT_RECORD.size > len(data):
+                    break
+                player, x, y = SELECT_RECORD.unpack_from(data, offset)
+                offset += SELECT_RECORD.size
+                self.actions.setdefault(tick, []).append([SELECT, player, (x, y), None])
+            elif record_type in (GROW, ATTACK, BOT_MOVE):
+                if offset + MOVE_RECORD.size > len(data):
+                    break
+                player, x1, y1, x2, y2 = MOVE_RECORD.unpack_from(data, offset)
+                offset += MOVE_RECORD.size
+                if record_type == BOT_MOVE:
+                    self.bot_moves[(tick, player)] = None if x1 == NO_CELL else ((x1, y1), (x2, y2))
+                else:
+                    self.actions.setdefault(tick, []).append([record_type, player, (x1, y1), (x2, y2)])
+            elif record_type == KEYFRAME:
+                if offset + KEYFRAME_RECORD.size > len(data):
+                    break
+                winner, size = KEYFRAME_RECORD.unpack_from(data, offset)
+                offset += KEYFRAME_RECORD.size
+                if offset + size > len(data):
+                    break
+                board = zlib.decompress(data[offset:offset + size])
+                offset += size
+                count = len(self.cells[0])
+                owner = np.frombuffer(board, dtype=np.int8, count=count)
+                energy = np.frombuffer(board, dtype=np.int16, count=count, offset=count)
+                self.keyframes.append([tick, None if winner < 0 else winner, owner, energy])
+            else:
+                raise ValueError(f"unknown record type {record_type} in {path}")
+            self.last_tick = max(self.last_tick, tick)
+        self.keyframe_ticks = [keyframe[0] for keyframe in self.keyframes]
+        self.action_ticks = sorted(self.actions)
+
+    def create_simulation(self) -> Simulation:
+        """ Returns simulation at the first keyframe where recorded bots repeat their decisions """
+
+        simulation = Simulation(self.grid_map, [tuple(cell) for cell in self.header["start_cells"]],
+                                self.header["max_energy"], self.header["wait_ticks"],
+                                bots={player: ReplayBot(self) for player in self.header["bots"]},
+                                seed=self.header.get("seed"))
+        self.seek(simulation, self.keyframe_ticks[0])
+        return simulation
+
+    def restore(self, simulation, keyframe):
+        """ Sets board of the simulation to the keyframe """
+
+        tick, winner, owner, energy = keyframe
+        simulation.owner[self.cells] = owner
+        simulation.energy[self.cells] = energy
+        simulation.changed[self.cells] = True
+        simulation.checksum = simulation.compute_checksum()
+        simulation.counter = tick
+        simulation.winner = winner
+
+    def seek(self, simulation, tick):
+        """ Sets simulation to the beginning of given tick """
+
+        if tick < simulation.counter or self.get_keyframe_index(tick) != self.get_keyframe_index(simulation.counter):
+            self.restore(simulation, self.keyframes[self.get_keyframe_index(tick)])
+        self.advance(simulation, tick)
+
+    def get_keyframe_index(self, tick) -> int:
+        """ Returns index of the last keyframe that is not later than given tick """
+
+        return max(bisect.bisect_right(self.keyframe_ticks, tick) - 1, 0)
+
+    def advance(self, simulation, tick):
+        """ Plays recorded actions up to the beginning of given tick """
+
+        while simulation.counter < tick:
+            for action, player, source, target in self.actions.get(simulation.counter, ()):
+                if action != SELECT:
+                    simulation.move(source, target)
+            simulation.step()
+            # ticks when nothing happens are skipped
+            next_action = bisect.bisect_left(self.action_ticks, simulation.counter)
+            next_action_tick = self.action_ticks[next_action] if next_action < len(self.action_ticks) else tick
+            simulation.counter += max(0, min(simulation.get_idle_ticks(), next_action_tick - simulation.counter,
+                                             tick - simulation.counter))
+
+    def verify(self):
+        """ Plays the whole match and returns the first tick where the board differs from a keyframe or None """
+
+        simulation = self.create_simulation()
+        for keyframe in self.keyframes[1:]:
+            self.advance(simulation, keyframe[0])
+            if not (np.array_equal(simulation.owner[self.cells], keyframe[2]) and
+                    np.array_equal(simulation.energy[self.cells], keyframe[3])):
+                return keyframe[0]
+        return None
+
+
+def main():
+    """ Opens the replay in the game or verifies it """
+
+    import argparse
+    import os
+
+    parser = argparse.ArgumentParser(description="Root Wars replay player")
+    parser.add_argument("path", help="replay file")
+    parser.add_argument("--speed", type=float, default=1, help="playback speed multiplier")
+    parser.add_argument("--tick", type=int, default=0, help="tick to start playback from")
+    parser.add_argument("--verify", action="store_true", help="check that playback matches recorded keyframes")
+    args = parser.parse_args()
+
+    replay = Replay(args.path)
+    if args.verify:
+        tick = replay.verify()
+        print(f"{args.path}: {replay.last_tick} ticks, {len(replay.keyframes)} keyframes, " +
+              ("ok" if tick is None else f"differs at tick {tick}"))
+        return
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    from base_app import App
+    app = App("Root Wars Replay")
+    app.game.watch_replay(replay, args.speed, args.tick)
+    app.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Headless Root Wars simulation.
+This file contains the game rules: board, ownership, energy ticks, captures and win/lose.
+It doesn't use pygame, so matches can be stepped without a display or fonts.
+Simulation is deterministic: all random decisions go through its own seeded generator and the board
+has a checksum that is updated with every change, so two runs can be compared tick by tick.
+"""
+
+import copy
+import random
+import time
+import numpy as np
+
+# owner ids, players of N-player matches are 1..N
+NEUTRAL = 0
+PLAYER = 1
+ENEMY = 2
+MAX_PLAYERS = 8
+
+# wait ticks between turns of humans and bots for every difficulty
+DIFFICULTY_WAIT_TICKS = {"Easy": [120, 180], "Normal": [120, 120], "Hard": [180, 120], "Super Hard": [240, 120]}
+# wait ticks are divided by the speed factor
+SPEED_FACTORS = {"Slow": 0.5, "Normal": 1, "Fast": 2, "Super Fast": 4}
+
+MASK_64 = 0xFFFFFFFFFFFFFFFF
+# checksum keys by grid map shape
+cell_keys = {}
+
+
+def get_passable_mask(grid_map):
+    """ Returns boolean array that is True for grid map positions that hold a hexagon """
+
+    grid = np.array(grid_map, dtype=bool)
+    x = np.arange(grid.shape[0])[:, None]
+    y = np.arange(grid.shape[1])[None, :]
+    lattice = np.where(y % 2 == 0, x % 3 == 0, (x + 1) % 3 == 0)
+    return grid & lattice
+
+
+def get_mask_cells(mask) -> list:
+    """ Returns positions where mask is True in the order hexagons are created (row by row of y) """
+
+    ys, xs = np.nonzero(mask.T)
+    return list(zip(xs.tolist(), ys.tolist()))
+
+
+def get_hex_offsets(y) -> list:
+    """ Returns grid map offsets of the six neighbours of the hexagon in given row """
+
+    if y % 2 == 0:
+        return [(0, -2), (0, 2), (2, -1), (2, 1), (-1, -1), (-1, 1)]
+    return [(0, -2), (0, 2), (1, -1), (1, 1), (-2, -1), (-2, 1)]
+
+
+def get_neighbour_table(cells) -> dict:
+    """
+    Builds neighbour table of the grid map.
+    :param cells: hexagon positions in board order
+    :return: dictionary with neighbour positions in board order for every hexagon position
+    """
+
+    cell_index = {cell: i for i, cell in enumerate(cells)}
+    table = {}
+    for x, y in cells:
+        neighbours = [(x + dx, y + dy) for dx, dy in get_hex_offsets(y) if (x + dx, y + dy) in cell_index]
+        table[(x, y)] = tuple(sorted(neighbours, key=cell_index.get))
+    return table
+
+
+def get_cell_keys(shape) -> tuple:
+    """
+    Returns random 64-bit keys of energy and owner for every grid map position, the same for every game.
+    Checksum of the board is the sum of energy and owner of every cell multiplied by their keys.
+    """
+
+    if shape not in cell_keys:
+        # splitmix64 of the position index
+        z = np.arange(shape[0] * shape[1] * 2, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+        cell_keys[shape] = (z[0::2].reshape(shape), z[1::2].reshape(shape))
+    return cell_keys[shape]
+
+
+class Simulation:
+    """
+    Root Wars game rules.
+    Board is stored in arrays with the shape of the grid map, so cells are addressed by their
+    grid map position (hex_pos) as tuples and ticks work on the whole board at once.
+    Board checksum is a weighted sum of all cells, so every change of a cell updates it in constant time.
+    """
+
+    def __init__(self, grid_map, start_cells, max_energy=40, wait_ticks=120, bots=None, neighbours=None, seed=None):
+        """
+        :param start_cells: root cells of 2 to MAX_PLAYERS players, player ids are 1, 2, ... in this order
+        :param wait_ticks: ticks between turns, one number for all players or a list with a number for every player
+        :param bots: players controlled by bots, all players except PLAYER by default
+        """
+
+        if not 2 <= len(start_cells) <= MAX_PLAYERS:
+            raise ValueError(f"a match needs 2 to {MAX_PLAYERS} players, got {len(start_cells)}")
+        self.grid_map = grid_map
+        self.max_energy = max_energy
+        self.players = list(range(1, len(start_cells) + 1))
+        if isinstance(wait_ticks, (int, float)):
+            wait_ticks = [wait_ticks] * len(self.players)
+        self.wait_ticks = {player: max(1, round(wait)) for player, wait in zip(self.players, wait_ticks)}
+        # players controlled by bots, bot objects choose moves with get_move(simulation, player), None is the random bot
+        if bots is None:
+            bots = self.players[1:]
+        self.bots = dict(bots) if isinstance(bots, dict) else dict.fromkeys(bots)
+
+        self.passable = get_passable_mask(grid_map)
+        self.cells = get_mask_cells(self.passable)
+        self.cell_index = {cell: i for i, cell in enumerate(self.cells)}
+        # neighbour table can be taken from a compiled map, so it's not built again for every game
+        self.neighbours = neighbours if neighbours is not None else get_neighbour_table(self.cells)
+        self.owner = np.zeros(self.passable.shape, dtype=np.int8)
+        self.energy = np.zeros(self.passable.shape, dtype=np.int16)
+        self.changed = np.zeros(self.passable.shape, dtype=bool)
+        self.roots = {player: tuple(cell) for player, cell in zip(self.players, start_cells)}
+        self.root_players = {cell: player for player, cell in self.roots.items()}
+        # arrays of all players, so their turns and roots are checked at once
+        self.player_ids = np.array(self.players)
+        self.wait_array = np.array([self.wait_ticks[player] for player in self.players])
+        self.root_cells = tuple(np.array([self.roots[player] for player in self.players]).T)
+        # the only source of random decisions of the game, the same seed plays the same match
+        self.random = random.Random(seed)
+        self.energy_keys, self.owner_keys = get_cell_keys(self.passable.shape)
+        self.checksum = self.compute_checksum()
+
+        for player, cell in self.roots.items():
+            self.set_cell(cell, player, 1)
+
+        self.counter = 1
+        self.winner = None
+        # seconds spent in bot logic, read by the profiler
+        self.bot_time = 0.0
+        # replay writer that records bot decisions and keyframes
+        self.recorder = None
+
+    def copy(self):
+        """
+        Returns copy of the game that can be played without changing this game, map data is shared.
+        Copy has the state of the random generator, so it makes the same random decisions as this game.
+        """
+
+        simulation = copy.copy(self)
+        simulation.owner = self.owner.copy()
+        simulation.energy = self.energy.copy()
+        simulation.changed = self.changed.copy()
+        simulation.bots = dict(self.bots)
+        simulation.random = random.Random()
+        simulation.random.setstate(self.random.getstate())
+        simulation.recorder = None
+        return simulation
+
+    def compute_checksum(self) -> int:
+        """ Returns checksum of the whole board, used when the board arrays are replaced """
+
+        return int((self.energy_keys * self.energy.astype(np.uint64) +
+                    self.owner_keys * self.owner.astype(np.uint64))[self.passable].sum())
+
+    def get_idle_ticks(self) -> int:
+        """ Returns number of ticks before the next tick when players get energy """
+
+        return int((-self.counter % self.wait_array).min())
+
+    def set_cell(self, cell, owner, energy):
+        """ Sets owner and energy of the cell and remembers that it has changed """
+
+        self.checksum = (self.checksum + int(self.energy_keys[cell]) * (int(energy) - int(self.energy[cell])) +
+                         int(self.owner_keys[cell]) * (int(owner) - int(self.owner[cell]))) & MASK_64
+        self.owner[cell] = owner
+        self.energy[cell] = energy
+        self.changed[cell] = True
+
+    def set_cells(self, cells, owner, energy):
+        """
+        Sets owner and energy of many cells at once.
+        :param cells: tuple of x and y arrays of the cells
+        """
+
+        owner_change = (owner.astype(np.int64) - self.owner[cells]).astype(np.uint64)
+        energy_change = (energy.astype(np.int64) - self.energy[cells]).astype(np.uint64)
+        self.checksum = (self.checksum + int((self.energy_keys[cells] * energy_change +
+                                              self.owner_keys[cells] * owner_change).sum())) & MASK_64
+        self.owner[cells] = owner
+        self.energy[cells] = energy
+        self.changed[cells] = True
+
+    def pop_changed(self) -> list:
+        """ Returns cells changed since the last call """
+
+        changed = get_mask_cells(self.changed)
+        self.changed[:] = False
+        return changed
+
+    def get_player_cells(self, player) -> list:
+        """ Returns all cells of the player """
+
+        return get_mask_cells(self.owner == player)
+
+    def count_player_cells(self, player) -> int:
+        """ Returns number of cells of the player """
+
+        return int(np.count_nonzero(self.owner == player))
+
+    def get_targets(self, cell) -> list:
+        """ Returns cells where root from given cell can grow or attack """
+
+        owner = self.owner[cell]
+        return [neighbour for neighbour in self.neighbours[cell] if self.owner[neighbour] != owner]
+
+    def can_move(self, source, target) -> bool:
+        """ Checks if root from source cell can grow or attack target cell """
+
+        return self.owner[source] != NEUTRAL and self.energy[source] > 1 and target in self.get_targets(source)
+
+    def move(self, source, target, energy=1) -> bool:
+        """
+        Grows root from source cell to the target cell or attacks it if it belongs to other player.
+        :param energy: energy of the new cell when root grows on neutral cell
+        :return: True if move was made
+        """
+
+        if self.winner is not None or not self.can_move(source, target):
+            return False
+        player = self.owner[source]
+        defender = int(self.owner[target])
+        root_captured = False
+        if defender == NEUTRAL:
+            self.set_cell(source, player, self.energy[source] - 1)
+            self.set_cell(target, player, energy)
+        else:
+            attack = self.energy[source] - 1
+            self.set_cell(source, player, self.energy[source] - attack)
+            self.set_cell(target, defender, self.energy[target] - attack)
+            if self.energy[target] <= 0:
+                self.set_cell(target, player, -self.energy[target])
+                root_captured = self.root_players.get(target) == defender
+        self.check_winner()
+        # player without the root is out, the game goes on if more than one player is left
+        if root_captured and self.winner is None:
+            self.eliminate(defender)
+        return True
+
+    def eliminate(self, player):
+        """ Removes the player from the game, all its cells become neutral """
+
+        cells = np.nonzero(self.owner == player)
+        self.set_cells(cells, np.zeros(len(cells[0]), dtype=np.int8), np.zeros(len(cells[0]), dtype=np.int16))
+
+    def get_alive(self) -> np.ndarray:
+        """ Returns boolean array that is True for players that still have their roots, in player order """
+
+        return self.owner[self.root_cells] == self.player_ids
+
+    def regen(self, players):
+        """ Increases energy of all cells of given players by one up to max energy in one pass over the board """
+
+        due = np.zeros(MAX_PLAYERS + 1, dtype=bool)
+        due[players] = True
+        growing = due[self.owner] & (self.energy < self.max_energy)
+        positions = np.flatnonzero(growing)
+        self.energy.ravel()[positions] += 1
+        self.changed |= growing
+        self.checksum = (self.checksum + int(self.energy_keys.ravel()[positions].sum())) & MASK_64
+
+    def get_random_move(self, player):
+        """ Returns move from a random cell of the player to its first available target or None """
+
+        cells = self.get_player_cells(player)
+        if not cells:
+            return None
+        source = self.random.choice(cells)
+        targets = self.get_targets(source)
+        if targets:
+            return source, targets[0]
+        return None
+
+    def bot_move(self, player):
+        """ Makes move of the bot that plays for given player """
+
+        bot = self.bots[player]
+        move = self.get_random_move(player) if bot is None else bot.get_move(self, player)
+        if self.recorder is not None:
+            self.recorder.bot_move(self, player, move)
+        if move is not None:
+            # bot cells start empty and are filled by the energy tick that follows
+            self.move(*move, energy=0)
+
+    def check_winner(self):
+        """ Finishes the game when only one player has its root, the one that owns the whole map has all roots """
+
+        alive = self.player_ids[self.get_alive()]
+        if len(alive) == 1:
+            self.winner = int(alive[0])
+
+    def step(self):
+        """ Makes one game tick: bots whose turn it is move, then all these players get energy at once """
+
+        if self.winner is None:
+            due = self.player_ids[(self.counter % self.wait_array == 0) & self.get_alive()]
+            if len(due):
+                for player in due.tolist():
+                    if player in self.bots:
+                        start = time.perf_counter()
+                        self.bot_move(player)
+                        self.bot_time += time.perf_counter() - start
+                self.regen(due)
+            self.check_winner()
+
+        self.counter += 1
+        if self.recorder is not None:
+            self.recorder.tick(self)
@@ -0,0 +1,151 @@
+"""
+Game snapshots.
+Snapshot is a fixed-layout binary file: a header with counters, settings, selection, camera and
+random generator state, followed by grid map, owner and energy arrays of the whole board.
+Files are read through mmap and arrays are used in place, so loading a match is close to instant
+and tools can scan many snapshots with numpy without unpickling anything.
+"""
+
+import mmap
+import os
+import numpy as np
+from simulation import *
+
+SNAPSHOT_MAGIC = b"RWSN"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u2"),
+    ("shape", "<u2", 2),
+    ("counter", "<u4"),
+    ("winner", "i1"),
+    ("players", "u1"),
+    ("bots", "u1", MAX_PLAYERS),
+    ("max_energy", "<u2"),
+    ("wait_ticks", "<u4", MAX_PLAYERS),
+    ("roots", "<u2", (MAX_PLAYERS, 2)),
+    ("selected", "<u2", 2),
+    ("cords", "<f8", 2),
+    ("map", "S32"),
+    ("map_seed", "<i8"),
+    ("seed", "<i8"),
+    ("difficulty", "S16"),
+    ("speed", "S16"),
+    ("game_mode", "S16"),
+    ("random_state", "<u4", 625),
+    ("gauss_next", "<f8"),
+    ("has_gauss_next", "u1"),
+])
+# values of selected cell and seeds when there is nothing to save
+NO_SELECTION = 0xFFFF
+NO_SEED = -1
+
+
+def save_snapshot(path, simulation, selected=None, cords=(0, 0), map_name="", map_seed=None, seed=None,
+                  difficulty="", speed="", game_mode=""):
+    """ Writes the match to a snapshot file, the file is replaced only when it's fully written """
+
+    header = np.zeros(1, dtype=SNAPSHOT_HEADER)[0]
+    header["magic"] = SNAPSHOT_MAGIC
+    header["version"] = SNAPSHOT_VERSION
+    header["shape"] = simulation.passable.shape
+    header["counter"] = simulation.counter
+    header["winner"] = -1 if simulation.winner is None else simulation.winner
+    players = len(simulation.players)
+    header["players"] = players
+    header["bots"][:players] = [player in simulation.bots for player in simulation.players]
+    header["max_energy"] = simulation.max_energy
+    header["wait_ticks"][:players] = [simulation.wait_ticks[player] for player in simulation.players]
+    header["roots"][:players] = [simulation.roots[player] for player in simulation.players]
+    header["selected"] = (NO_SELECTION, NO_SELECTION) if selected is None else selected
+    header["cords"] = cords
+    header["map"] = (map_name or "").encode()
+    header["map_seed"] = NO_SEED if map_seed is None else map_seed
+    header["seed"] = NO_SEED if seed is None else seed
+    header["difficulty"] = difficulty.encode()
+    header["speed"] = speed.encode()
+    header["game_mode"] = game_mode.encode()
+    version, state, gauss_next = simulation.random.getstate()
+    header["random_state"] = state
+    header["has_gauss_next"] = gauss_next is not None
+    header["gauss_next"] = gauss_next or 0
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "wb") as file:
+        file.write(header.tobytes())
+        file.write(np.asarray(simulation.grid_map, dtype=np.uint8).tobytes())
+        file.write(simulation.owner.astype(np.int8).tobytes())
+        file.write(simulation.energy.astype("<i2").tobytes())
+    os.replace(path + ".tmp", path)
+
+
+class Snapshot:
+    """ Snapshot file opened through mmap, its arrays are views of the file """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header = np.frombuffer(self.map, dtype=SNAPSHOT_HEADER, count=1)[0]
+        if self.header["magic"] != SNAPSHOT_MAGIC or self.header["version"] != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a snapshot of version {SNAPSHOT_VERSION}")
+
+        shape = tuple(int(size) for size in self.header["shape"])
+        size = shape[0] * shape[1]
+        offset = SNAPSHOT_HEADER.itemsize
+        self.grid_map = np.frombuffer(self.map, dtype=np.uint8, count=size, offset=offset).reshape(shape)
+        self.owner = np.frombuffer(self.map, dtype=np.int8, count=size, offset=offset + size).reshape(shape)
+        self.energy = np.frombuffer(self.map, dtype="<i2", count=size, offset=offset + size * 2).reshape(shape)
+
+    def get_text(self, field) -> str:
+        """ Returns text field of the header """
+
+        return self.header[field].decode()
+
+    def get_selected(self):
+        """ Returns selected cell or None """
+
+        selected = tuple(int(i) for i in self.header["selected"])
+        return None if selected[0] == NO_SELECTION else selected
+
+    def get_seed(self, field):
+        """ Returns seed field of the header or None """
+
+        seed = int(self.header[field])
+        return None if seed == NO_SEED else seed
+
+    def get_roots(self) -> list:
+        """ Returns root cells of all players """
+
+        return [tuple(int(i) for i in root) for root in self.header["roots"][:self.header["players"]]]
+
+    def create_simulation(self, neighbours=None) -> Simulation:
+        """ Returns simulation with the saved board, bot players get random bots """
+
+        players = int(self.header["players"])
+        bots = [player for player, bot in enumerate(self.header["bots"][:players], 1) if bot]
+        simulation = Simulation(self.grid_map.astype(bool), self.get_roots(), int(self.header["max_energy"]),
+                                self.header["wait_ticks"][:players].tolist(), bots=bots, neighbours=neighbours)
+        simulation.owner[:] = self.owner
+        simulation.energy[:] = self.energy
+        simulation.changed[:] = simulation.passable
+        simulation.checksum = simulation.compute_checksum()
+        gauss_next = float(self.header["gauss_next"]) if self.header["has_gauss_next"] else None
+        simulation.random.setstate((3, tuple(int(i) for i in self.header["random_state"]), gauss_next))
+        simulation.counter = int(self.header["counter"])
+        winner = int(self.header["winner"])
+        simulation.winner = None if winner < 0 else winner
+        return simulation
+
+    def close(self):
+        """ Releases the file, arrays of the snapshot can't be used after that """
+
+        self.header = self.grid_map = self.owner = self.energy = None
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
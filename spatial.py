@@ -0,0 +1,44 @@
+"""
+Spatial index for game objects.
+Splits the world into square chunks, so objects that are visible on the screen
+can be found without checking every object of the map.
+"""
+
+
+class SpatialGrid:
+    """ Uniform grid of world chunks that remembers which objects intersect every chunk """
+
+    def __init__(self, chunk_size=512):
+        self.chunk_size = chunk_size
+        self.chunks = {}
+        self.order = {}
+
+    def get_chunks(self, rect):
+        """ Returns keys of all chunks that intersect given [x, y, width, height] rectangle """
+
+        x1 = int(rect[0] // self.chunk_size)
+        y1 = int(rect[1] // self.chunk_size)
+        x2 = int((rect[0] + rect[2]) // self.chunk_size)
+        y2 = int((rect[1] + rect[3]) // self.chunk_size)
+        return [(x, y) for y in range(y1, y2 + 1) for x in range(x1, x2 + 1)]
+
+    def insert(self, obj, rect):
+        """ Adds object that occupies given [x, y, width, height] rectangle of the world """
+
+        self.order.setdefault(obj, len(self.order))
+        for key in self.get_chunks(rect):
+            self.chunks.setdefault(key, []).append(obj)
+
+    def query(self, rect) -> list:
+        """ Returns objects from the chunks that intersect given rectangle in the order they were inserted """
+
+        found = set()
+        for key in self.get_chunks(rect):
+            found.update(self.chunks.get(key, ()))
+        return sorted(found, key=self.order.get)
+
+    def clear(self):
+        """ Removes all objects """
+
+        self.chunks.clear()
+        self.order.clear()
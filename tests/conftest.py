@@ -0,0 +1,13 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def game_directory(monkeypatch):
+    """ Runs tests in the game directory, maps are loaded by relative paths """
+
+    monkeypatch.chdir(ROOT)
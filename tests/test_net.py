@@ -0,0 +1,122 @@
+import asyncio
+import numpy as np
+from net import *
+
+OPTIONS = {"map": "Two-Way", "difficulty": "Normal", "speed": "Super Fast", "players": 4, "humans": 2}
+
+
+async def start_match(server, name, options=OPTIONS):
+    """ Returns clients of all humans of a new started match """
+
+    port = server.server.sockets[0].getsockname()[1]
+    clients = [Client() for i in range(options["humans"])]
+    for client in clients:
+        await client.connect("localhost", port)
+    await asyncio.gather(*[client.join(name, **options) for client in clients])
+    return clients
+
+
+async def receive_until(client, message_types, timeout=5):
+    """ Reads messages until one of given types comes and returns it """
+
+    while True:
+        message_type, payload = await asyncio.wait_for(read_message(client.reader), timeout)
+        if message_type in message_types:
+            return message_type, payload
+        client.apply(message_type, payload)
+
+
+def test_delta_round_trip():
+    grid_map, start_cells = get_map("generated:40", 3, 3)
+    simulation = Simulation(grid_map, start_cells, seed=3)
+    simulation.changed[:] = False
+    for i in range(600):
+        simulation.step()
+    # big and small deltas, compressed and plain
+    for count in (len(simulation.cells), 3):
+        simulation.changed[:] = False
+        simulation.changed[tuple(np.array(simulation.cells[:count]).T)] = True
+        tick, checksum, cells, owner, energy = decode_delta(encode_delta(simulation))
+        assert (tick, checksum) == (simulation.counter, simulation.checksum)
+        assert sorted(zip(*[i.tolist() for i in cells])) == sorted(simulation.cells[:count])
+        assert np.array_equal(owner, simulation.owner[cells])
+        assert np.array_equal(energy, simulation.energy[cells])
+        assert not simulation.changed.any()
+
+
+def test_invalid_moves_are_rejected():
+    async def run():
+        server = Server(tick_rate=600)
+        await server.start("localhost", 0)
+        other = await start_match(server, "other")
+        clients = await start_match(server, "bad")
+        match = server.matches["bad"]
+        root = match.simulation.roots[clients[0].player]
+        for source, target in [((60000, 1), root), (root, (1, 60000)), ((1, 1), root)]:
+            client = (await start_match(server, f"bad-{source}"))[0]
+            client.move(source, target)
+            message_type, payload = await receive_until(client, (ERROR,))
+            assert b"not on the board" in payload
+        # moves from cells of other players are dropped
+        assert not match.check_move(clients[0].player, match.simulation.roots[clients[1].player], root)
+        counter = server.matches["other"].simulation.counter
+        await asyncio.sleep(0.2)
+        assert server.matches["other"].simulation.counter > counter
+        for client in clients + other:
+            client.close()
+        await server.stop()
+
+    asyncio.run(run())
+
+
+def test_broken_match_does_not_stop_others():
+    async def run():
+        server = Server(tick_rate=600)
+        await server.start("localhost", 0)
+        good = await start_match(server, "good")
+        broken = await start_match(server, "broken")
+
+        def tick():
+            raise IndexError("broken tick")
+
+        server.matches["broken"].tick = tick
+        message_type, payload = await receive_until(broken[0], (ERROR,))
+        assert "broken" not in server.matches
+        counter = server.matches["good"].simulation.counter
+        await asyncio.sleep(0.2)
+        assert server.matches["good"].simulation.counter > counter
+        for client in good + broken:
+            client.close()
+        await server.stop()
+
+    asyncio.run(run())
+
+
+def test_server_match_equals_local_simulation():
+    async def run():
+        server = Server(tick_rate=1000, send_ticks=1)
+        await server.start("localhost", 0)
+        clients = await start_match(server, "match")
+        header = clients[0].header
+        local = Simulation(clients[0].grid_map, [tuple(cell) for cell in header["start_cells"]], header["max_energy"],
+                           header["wait_ticks"], bots=range(header["humans"] + 1, header["players"] + 1),
+                           seed=header["seed"])
+        checked = 0
+        while checked < 20:
+            message_type, payload = await receive_until(clients[0], (DELTA, END))
+            clients[0].apply(message_type, payload)
+            if message_type == END:
+                break
+            while local.counter < clients[0].simulation.counter:
+                local.step()
+            assert clients[0].simulation.checksum == local.checksum
+            assert np.array_equal(clients[0].simulation.owner, local.owner)
+            assert np.array_equal(clients[0].simulation.energy, local.energy)
+            checked += 1
+        assert clients[0].desyncs == 0
+        assert local.counter > max(local.wait_ticks.values()) * 3
+        for client in clients:
+            client.close()
+        await server.stop()
+
+    asyncio.run(run())
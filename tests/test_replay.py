@@ -0,0 +1,110 @@
+import json
+import numpy as np
+import pytest
+from maps import get_map
+from replay import *
+
+SEED = 8
+
+
+def play(ticks, path=None):
+    """
+    Plays seeded 3-player match where player 1 grows from its first cell that can move every 50 ticks.
+    :param path: replay file the match is recorded to
+    :return: simulation at the beginning of given tick
+    """
+
+    grid_map, start_cells = get_map("generated:30", SEED, 3)
+    simulation = Simulation(grid_map, start_cells, 30, [40, 50, 60], seed=SEED)
+    writer = None if path is None else ReplayWriter(path, simulation, keyframe_ticks=200, seed=SEED)
+    while simulation.counter < ticks:
+        if simulation.counter % 50 == 0:
+            move = next(((source, target) for source in simulation.get_player_cells(PLAYER)
+                         for target in simulation.get_targets(source) if simulation.can_move(source, target)), None)
+            if move is not None:
+                attack = simulation.owner[move[1]] != NEUTRAL
+                simulation.move(*move)
+                if writer is not None:
+                    writer.move(simulation, PLAYER, *move, attack)
+        simulation.step()
+    if writer is not None:
+        writer.close(simulation)
+    return simulation
+
+
+@pytest.fixture(scope="module")
+def replay_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("replays") / "match.rwr")
+    play(1000, path)
+    return path
+
+
+def assert_same_board(simulation, expected):
+    assert simulation.counter == expected.counter
+    assert np.array_equal(simulation.owner, expected.owner)
+    assert np.array_equal(simulation.energy, expected.energy)
+    assert simulation.checksum == expected.checksum
+    assert simulation.winner == expected.winner
+
+
+def test_replay_header(replay_path):
+    replay = Replay(replay_path)
+    expected = play(0)
+    assert np.array_equal(replay.grid_map, np.asarray(expected.grid_map, dtype=bool))
+    assert [tuple(cell) for cell in replay.header["start_cells"]] == [expected.roots[i] for i in expected.players]
+    assert replay.header["wait_ticks"] == [40, 50, 60]
+    assert replay.header["bots"] == [2, 3]
+    assert replay.header["seed"] == SEED
+    # closed replay ends with a keyframe of the last tick
+    assert replay.keyframe_ticks == [1, 200, 400, 600, 800, 1000, 1000]
+    assert replay.last_tick == 1000
+    assert replay.verify() is None
+
+
+@pytest.mark.parametrize("tick", [1, 123, 200, 517, 999, 1000])
+def test_seek_equals_played_match(replay_path, tick):
+    replay = Replay(replay_path)
+    simulation = replay.create_simulation()
+    replay.seek(simulation, tick)
+    assert_same_board(simulation, play(tick))
+
+
+def test_seek_backwards(replay_path):
+    replay = Replay(replay_path)
+    simulation = replay.create_simulation()
+    replay.seek(simulation, 900)
+    replay.seek(simulation, 333)
+    assert_same_board(simulation, play(333))
+
+
+def test_truncated_replay_plays_recorded_part(replay_path, tmp_path):
+    with open(replay_path, "rb") as file:
+        data = file.read()
+    path = str(tmp_path / "truncated.rwr")
+    # the last keyframe and a part of the one before are cut off
+    last_keyframe = Replay(replay_path).keyframes[-1]
+    with open(path, "wb") as file:
+        file.write(data[:len(data) - len(last_keyframe[2]) * 3 - 10])
+    replay = Replay(path)
+    assert replay.keyframe_ticks[-1] < 1000
+    simulation = replay.create_simulation()
+    replay.seek(simulation, 700)
+    assert_same_board(simulation, play(700))
+
+
+def test_corrupt_replay_is_rejected(replay_path, tmp_path):
+    with open(replay_path, "rb") as file:
+        data = file.read()
+    path = str(tmp_path / "corrupt.rwr")
+    with open(path, "wb") as file:
+        file.write(b"XXXX" + data[4:])
+    with pytest.raises(ValueError):
+        Replay(path)
+
+    # unknown record type right after the first keyframe
+    replay = Replay(replay_path)
+    header_size = HEADER.size + len(json.dumps(replay.header).encode()) + len(np.packbits(replay.grid_map))
+    with open(path, "wb") as file:
+        file.write(data[:header_size] + RECORD.pack(99, 1) + data[header_size:])
+    with pytest.raises(ValueError):
+        Replay(path)
@@ -0,0 +1,44 @@
+from bots import *
+from maps import get_map
+
+
+def create_match(seed):
+    """ Returns 3-player match with a rollout bot in fixed-budget mode and a random bot """
+
+    grid_map, start_cells = get_map("generated:24", seed, 3)
+    simulation = Simulation(grid_map, start_cells, 20, [30, 40, 50], bots=[2, 3], seed=seed)
+    simulation.bots[2] = RolloutBot(simulation, workers=0, depth=3, max_moves=6, rollouts=8)
+    return simulation
+
+
+def test_same_seed_plays_the_same_match():
+    first, second = create_match(5), create_match(5)
+    for i in range(3000):
+        first.step()
+        second.step()
+        assert first.checksum == second.checksum
+        if first.winner is not None:
+            break
+    assert first.winner == second.winner
+    assert np.array_equal(first.owner, second.owner) and np.array_equal(first.energy, second.energy)
+    assert first.count_player_cells(2) > 1
+
+
+def test_fixed_budget_search_ignores_time():
+    simulation = create_match(7)
+    for i in range(600):
+        simulation.step()
+    moves = get_moves(simulation, 2)
+    results = [search(simulation, simulation.owner, simulation.energy, simulation.counter, 2, moves, time_budget,
+                      3, 11, rollouts=20)
+               for time_budget in (0, 0.2)]
+    assert np.array_equal(results[0][0], results[1][0]) and np.array_equal(results[0][1], results[1][1])
+    assert results[0][0].sum() == max(20, len(moves))
+
+
+def test_checksum_equals_full_recompute():
+    simulation = create_match(9)
+    for i in range(1500):
+        simulation.step()
+        if i % 100 == 0:
+            assert simulation.checksum == simulation.compute_checksum()
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from maps import get_map
+from snapshot import *
+
+
+def create_match(seed):
+    """ Returns 4-player match played for a while """
+
+    grid_map, start_cells = get_map("generated:30", seed, 4)
+    simulation = Simulation(grid_map, start_cells, 30, [30, 40, 50, 60], bots=[2, 3, 4], seed=seed)
+    for i in range(1000):
+        simulation.step()
+    return simulation
+
+
+def test_snapshot_round_trip(tmp_path):
+    simulation = create_match(4)
+    path = str(tmp_path / "match.rws")
+    save_snapshot(path, simulation, selected=simulation.roots[PLAYER], cords=(10.5, -20), map_name="generated:30",
+                  map_seed=4, seed=4, difficulty="Hard", speed="Fast", game_mode="Classic")
+
+    with Snapshot(path) as snapshot:
+        restored = snapshot.create_simulation()
+        assert snapshot.get_selected() == simulation.roots[PLAYER]
+        assert tuple(snapshot.header["cords"]) == (10.5, -20)
+        assert (snapshot.get_text("map"), snapshot.get_text("difficulty"), snapshot.get_text("speed")) == \
+               ("generated:30", "Hard", "Fast")
+        assert snapshot.get_seed("seed") == 4
+        assert snapshot.get_roots() == [simulation.roots[player] for player in simulation.players]
+
+    assert np.array_equal(restored.owner, simulation.owner)
+    assert np.array_equal(restored.energy, simulation.energy)
+    assert restored.checksum == simulation.checksum
+    assert restored.counter == simulation.counter
+    assert restored.wait_ticks == simulation.wait_ticks
+    assert sorted(restored.bots) == sorted(simulation.bots)
+    assert restored.random.getstate() == simulation.random.getstate()
+
+    for i in range(1000):
+        simulation.step()
+        restored.step()
+        assert restored.checksum == simulation.checksum
+    assert np.array_equal(restored.owner, simulation.owner)
+    assert restored.winner == simulation.winner
+
+
+def test_snapshot_of_other_version_is_rejected(tmp_path):
+    path = str(tmp_path / "match.rws")
+    save_snapshot(path, create_match(6))
+    with open(path, "r+b") as file:
+        file.seek(4)
+        file.write((SNAPSHOT_VERSION + 1).to_bytes(2, "little"))
+    with pytest.raises(ValueError):
+        Snapshot(path)
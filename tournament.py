@@ -0,0 +1,187 @@
+"""
+Headless bot tournament.
+Plays matches between bot configurations on every combination of maps, difficulties and speeds
+on all CPU cores. Every finished match is written to a json lines file with its winner, length and
+energy curves, and win rates of every configuration are added at the end, so difficulty tables can
+be tuned from data.
+
+Bots: random, rollout:<rollouts per move>[:<turns per rollout>]
+Maps: names of the game maps or generated:<size>
+
+Usage:
+    python tournament.py --games 1000 --output tournament.jsonl
+    python tournament.py --bots random rollout:64:10 --difficulties Normal Hard --maps Two-Way generated:64
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from bots import *
+from mapgen import *
+
+PLAYER_NAMES = {PLAYER: "player", ENEMY: "enemy"}
+# rollouts of one search and turns of one rollout of rollout bots, a match takes a few seconds
+ROLLOUTS = 16
+ROLLOUT_DEPTH = 5
+
+
+def create_bot(name, simulation):
+    """
+    Returns bot object for the bot name, None for the random bot.
+    Rollout bots run a fixed number of rollouts instead of a time budget, so matches replay from their seed.
+    """
+
+    if name == "random":
+        return None
+    if name.startswith("rollout"):
+        parts = name.split(":")
+        rollouts = int(parts[1]) if len(parts) > 1 else ROLLOUTS
+        depth = int(parts[2]) if len(parts) > 2 else ROLLOUT_DEPTH
+        # every compared move gets two rollouts on average
+        return RolloutBot(simulation, workers=0, depth=depth, max_moves=max(2, rollouts // 2), rollouts=rollouts)
+    raise ValueError(f"unknown bot {name}")
+
+
+def play_match(match) -> dict:
+    """ Plays one headless match and returns its result with energy and cell curves of both players """
+
+    grid_map, start_cells = get_map(match["map"], match["seed"])
+    player_wait_ticks, enemy_wait_ticks = DIFFICULTY_WAIT_TICKS[match["difficulty"]]
+    speed_factor = SPEED_FACTORS[match["speed"]]
+    simulation = Simulation(grid_map, start_cells, match["max_energy"],
+                            [player_wait_ticks / speed_factor, enemy_wait_ticks / speed_factor],
+                            bots=(PLAYER, ENEMY), seed=match["seed"])
+    for player, bot in zip((PLAYER, ENEMY), match["bots"]):
+        simulation.bots[player] = create_bot(bot, simulation)
+
+    curves = {"ticks": []}
+    for player, name in PLAYER_NAMES.items():
+        curves[name + "_energy"] = []
+        curves[name + "_cells"] = []
+    sample_ticks = match["sample_ticks"]
+    start = time.perf_counter()
+    while simulation.winner is None and simulation.counter < match["max_ticks"]:
+        # ticks when nothing happens are skipped
+        simulation.counter += min(simulation.get_idle_ticks(), -simulation.counter % sample_ticks)
+        if simulation.counter % sample_ticks == 0:
+            curves["ticks"].append(simulation.counter)
+            for player, name in PLAYER_NAMES.items():
+                cells = simulation.owner == player
+                curves[name + "_energy"].append(int(simulation.energy[cells].sum()))
+                curves[name + "_cells"].append(int(np.count_nonzero(cells)))
+        simulation.step()
+
+    result = dict(match)
+    result.update({
+        "type": "match",
+        "winner": PLAYER_NAMES.get(simulation.winner),
+        "ticks": simulation.counter,
+        "checksum": simulation.checksum,
+        "seconds": time.perf_counter() - start,
+        "bot_seconds": simulation.bot_time,
+        "curves": curves,
+    })
+    return result
+
+
+def get_matches(args) -> list:
+    """ Returns matches of all combinations of bots, maps, difficulties and speeds """
+
+    matches = []
+    configurations = itertools.product(itertools.product(args.bots, repeat=2), args.maps, args.difficulties,
+                                       args.speeds)
+    for bots, map_name, difficulty, speed in configurations:
+        for i in range(args.games):
+            matches.append({"id": len(matches), "seed": args.seed + len(matches), "bots": list(bots),
+                            "map": map_name, "difficulty": difficulty, "speed": speed,
+                            "max_energy": args.max_energy, "max_ticks": args.max_ticks,
+                            "sample_ticks": args.sample_ticks})
+    return matches
+
+
+def get_configuration(result) -> tuple:
+    """ Returns key of the configuration the match belongs to """
+
+    return tuple(result["bots"]), result["map"], result["difficulty"], result["speed"]
+
+
+class Summary:
+    """ Win rates and game lengths of every configuration """
+
+    def __init__(self):
+        self.configurations = {}
+
+    def add(self, result):
+        """ Adds finished match """
+
+        stats = self.configurations.setdefault(get_configuration(result),
+                                               {"games": 0, "player": 0, "enemy": 0, "draw": 0, "ticks": 0})
+        stats["games"] += 1
+        stats[result["winner"] or "draw"] += 1
+        stats["ticks"] += result["ticks"]
+
+    def get_rows(self) -> list:
+        """ Returns summary of every configuration """
+
+        rows = []
+        for (bots, map_name, difficulty, speed), stats in self.configurations.items():
+            rows.append({
+                "type": "summary", "bots": list(bots), "map": map_name, "difficulty": difficulty, "speed": speed,
+                "games": stats["games"],
+                "player_win_rate": stats["player"] / stats["games"],
+                "enemy_win_rate": stats["enemy"] / stats["games"],
+                "draw_rate": stats["draw"] / stats["games"],
+                "mean_ticks": stats["ticks"] / stats["games"],
+            })
+        return rows
+
+
+def main():
+    """ Plays the tournament and writes results """
+
+    parser = argparse.ArgumentParser(description="Root Wars bot tournament")
+    parser.add_argument("--output", default="tournament.jsonl", help="json lines file to write results to")
+    parser.add_argument("--games", type=int, default=25, help="matches of every configuration")
+    parser.add_argument("--bots", nargs="+", default=["random", f"rollout:{ROLLOUTS}"],
+                        help="bots that play against each other as the player and as the enemy")
+    parser.add_argument("--maps", nargs="+", default=["Two-Way"], help="map names or generated:<size>")
+    parser.add_argument("--difficulties", nargs="+", choices=list(DIFFICULTY_WAIT_TICKS),
+                        default=list(DIFFICULTY_WAIT_TICKS))
+    parser.add_argument("--speeds", nargs="+", choices=list(SPEED_FACTORS), default=["Normal"])
+    parser.add_argument("--max-energy", type=int, default=40)
+    parser.add_argument("--max-ticks", type=int, default=60 * 60 * 30,
+                        help="matches that last longer are draws, 60 ticks is one second of the game")
+    parser.add_argument("--sample-ticks", type=int, default=600, help="ticks between points of energy curves")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first match")
+    args = parser.parse_args()
+    # output path is given relative to the working directory, not to the game directory
+    args.output = os.path.abspath(args.output)
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    matches = get_matches(args)
+    summary = Summary()
+    start = time.perf_counter()
+    with open(args.output, "w") as file, ProcessPoolExecutor(args.workers) as executor:
+        futures = [executor.submit(play_match, match) for match in matches]
+        for i, future in enumerate(as_completed(futures)):
+            result = future.result()
+            summary.add(result)
+            file.write(json.dumps(result) + "\n")
+            file.flush()
+            if (i + 1) % 100 == 0 or i + 1 == len(matches):
+                print(f"{i + 1}/{len(matches)} matches, {time.perf_counter() - start:.1f} s")
+        for row in summary.get_rows():
+            file.write(json.dumps(row) + "\n")
+
+    for row in summary.get_rows():
+        name = f"{row['bots'][0]} vs {row['bots'][1]} {row['map']} {row['difficulty']} {row['speed']}"
+        print(f"{name:<64}player {row['player_win_rate']:>6.1%}  enemy {row['enemy_win_rate']:>6.1%}  "
+              f"draw {row['draw_rate']:>6.1%}  {row['mean_ticks'] / 60:>8.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,16 +11,26 @@ Update method of this class is called every 0.02 seconds (60 FPS (Depends on wha
 
 # TODO: ADD SPECIAL EFFECTS
 # TODO: ADD MUSIC
-# TODO: CREATE MINIMAP
 # TODO: CREATE DIFFERENT MAPS
 # TODO: CREATE LEVEL EDITOR
 # TODO: CREATE LEVELS
 # TODO: USE DAMN GPU
-# TODO: CREATE MULTIPLAYER
+# TODO: CREATE MULTIPLAYER <COMPLETE EXCEPT LOBBY MENU (net.py play)>
 
 import pygame
+from assets import *
 from objects import *
+from simulation import *
+from spatial import *
+from maps import *
+from mapgen import *
+from bots import *
+from replay import *
+from snapshot import *
+from net import *
+import os
 import random
+import time
 
 
 class Game:
@@ -48,9 +58,12 @@ class Game:
         self.navigation_speed = 30
         self.max_energy = 40
         self.hexagon_size = 100
-        self.min_hexagon_size = 60
+        self.min_hexagon_size = 40
         self.max_hexagon_size = 100
+        self.zoom_step = 10
         self.map_move_reaction = 2
+        self.tick_rate = 60
+        self.max_ticks_per_frame = 10
         self.grid_line_width = 5
         self.grid_hex_width = 5
         self.grid_line_color = (200, 200, 200, 255)
@@ -62,23 +75,41 @@ class Game:
         self.selected_enemy_hexagon_color = (255, 255, 0)
         self.nearby_hexagon_color = (0, 255, 0)
 
-        self.difficulties = ["Easy", "Normal", "Hard", "Super Hard"]
-        self.speeds = ["Slow", "Normal", "Fast", "Super Fast"]
+        self.difficulties = list(DIFFICULTY_WAIT_TICKS)
+        self.speeds = list(SPEED_FACTORS)
         self.colors = [(255, 0, 0), (255, 255, 0), (0, 255, 0), (0, 255, 255), (0, 0, 255), (100, 0, 150),
                        (150, 255, 0), (255, 255, 255), (255, 0, 255), (0, 255, 150)]
         self.player_colors = self.colors
         self.selected_root_colors = self.colors
         self.nearby_hexagon_colors = self.colors
         self.game_modes = ["Classic", "Fast"]
-        self.maps = ["Two-Way"]
+        self.player_counts = list(range(2, MAX_PLAYERS + 1))
+        self.maps = list(MAP_FILES) + list(GENERATED_MAP_SIZES)
 
-        self.background_image = pygame.transform.scale(pygame.image.load("background.jpg"),
-                                                       [self.app.WIDTH, self.app.HEIGHT])
+        self.background_image = assets.get_image("background.jpg", [self.app.WIDTH, self.app.HEIGHT])
 
         # settings variables
         self.SETTINGS_OBJECTS_CREATED = False
         self.FPS_ENABLED = False
         self.fps_label = Label(self, foreground=(0, 255, 0), font_size=40, font_name="Courier").percent(95, 2)
+        self.PROFILER_ENABLED = False
+        self.profiler_overlay = ProfilerOverlay(self, self.app.profiler, pos=[10, self.app.HEIGHT - 310])
+
+        # replay variables
+        self.replay = None
+        self.replay_speed = 1
+        self.replay_start_tick = 0
+        self.recorder = None
+        # matches are recorded into the replays folder
+        self.RECORDING_ENABLED = True
+
+        # match saved on exit to the main menu
+        self.save_path = os.path.join("saves", "autosave.rws")
+        self.snapshot = None
+
+        # multiplayer variables, the player id of the human is PLAYER in local games
+        self.network = None
+        self.human = PLAYER
 
         self.create_main_menu_objects()
 
@@ -102,6 +133,10 @@ class Game:
         self.info_button = Button(self, text="Info").percent_y(55)
         self.rules_button = Button(self, text="Rules").percent_y(65)
         self.exit_button = Button(self, text="Exit").percent_y(75)
+        self.continue_button = None
+        if os.path.exists(self.save_path):
+            self.continue_button = Button(self, text="Continue").percent_y(25)
+            self.main_menu_objects.append(self.continue_button)
 
         self.main_menu_objects.append(self.game_title_label)
         self.main_menu_objects.append(self.play_button)
@@ -129,6 +164,7 @@ class Game:
 
         self.game_mode_options = OptionButton(self, text="Game Mode: ", options=self.game_modes).percent(60, 30)
         self.map_options = OptionButton(self, text="Map: ", options=self.maps).percent(60, 40)
+        self.players_options = OptionButton(self, text="Players: ", options=self.player_counts).percent(60, 50)
 
         self.start_game_button = Button(self, text="Start Game", font_size=80).percent(60, 68)
 
@@ -143,6 +179,7 @@ class Game:
         self.new_game_objects.append(self.nearby_hexagon_color_picker)
         self.new_game_objects.append(self.game_mode_options)
         self.new_game_objects.append(self.map_options)
+        self.new_game_objects.append(self.players_options)
         self.new_game_objects.append(self.start_game_button)
         self.new_game_objects.append(self.back_button)
 
@@ -151,19 +188,27 @@ class Game:
 
         if not self.SETTINGS_OBJECTS_CREATED:
             self.fps_button = Button(self, text="Show fps").percent_y(10)
+            self.rendering_options = OptionButton(self, text="Rendering: ", options=["Full", "Dirty rects"])\
+                .percent_y(20)
+            self.profiler_button = Button(self, text="Show profiler").percent_y(30)
             self.back_button = Button(self, text="Back").percent(8, 8)
             self.info_text = Text(self, text=""
                                              "Navigation\n\n"
                                              "Drag mouse cursor to one of the sides of the screen\n"
                                              "to move the camera\n"
+                                             "Click the minimap to move the camera to that place\n"
+                                             "Zoom the map: Mouse Wheel\n"
                                              "\n\n"
                                              "Key settings\n\n"
                                              "Return to main menu: Escape\n"
                                              "Select your root: Left Mouse Button\n"
                                              "Place your root on available position: Left Mouse Button\n"
-                                             "\n").percent_y(20, x=100)
+                                             "Save profiler frames to a file: F12\n"
+                                             "\n").percent_y(40, x=100)
 
             self.settings_objects.append(self.fps_button)
+            self.settings_objects.append(self.rendering_options)
+            self.settings_objects.append(self.profiler_button)
             self.settings_objects.append(self.back_button)
             self.settings_objects.append(self.info_text)
 
@@ -210,60 +255,66 @@ class Game:
         self.info_objects.append(self.info_text)
         self.info_objects.append(self.back_button)
 
-    def get_pos_for_hex_grid(self, position, size):
-        """ Returns position for hex grid using given x and y coordinates """
-
-        x = position[0]
-        y = position[1]
-        should_offset = y % 2 == 0
-        width = pow(3, 0.5) * size
-        height = 2 * size
-        horizontal_distance = width
-        vertical_distance = height * (3 / 4)
-        offset = width / 2 if should_offset else 0
-        pos = [x * horizontal_distance + offset,
-               y * vertical_distance]
-        if self.grid_map[x][y]:
-            return pos
-        else:
-            return None
-
-    def add_hexagon(self, x, y, color, outline_color):
-        """ Adds hexagon object to the list of hexagons """
-
-        pos = self.get_pos_for_hex_grid(position=[x, y], size=self.hexagon_size)
-        hexagon = Hexagon(self, pos=pos,
-                          hexagon_size=[self.hexagon_size, self.hexagon_size],
-                          hex_pos=[x, y],
-                          color=color,
-                          outline_color=outline_color,
-                          foreground=(100, 100, 100))
-        if pos is not None:
-            if y % 2 == 0:
-                if x % 3 == 0:
-                    self.hexagons.append(hexagon)
-            elif (x + 1) % 3 == 0:
-                self.hexagons.append(hexagon)
-
     def create_hex_grid(self):
         """ Generates hexagon grid map """
 
-        for y in range(len(self.grid_map)):
-            for x in range(len(self.grid_map)):
-                self.add_hexagon(x, y, self.grid_hex_color, self.grid_hex_outline_color)
+        for (x, y), pos in zip(self.compiled_map.cells.tolist(), self.compiled_map.positions.tolist()):
+            self.hexagons.append(Hexagon(self, pos=pos,
+                                         hexagon_size=[self.hexagon_size, self.hexagon_size],
+                                         hex_pos=[x, y],
+                                         color=self.grid_hex_color,
+                                         outline_color=self.grid_hex_outline_color,
+                                         foreground=(100, 100, 100)))
 
-    def create_hex_grid_lines(self, i):
+    def create_hex_grid_lines(self):
         """ Generates lines connecting all hexagons on grid map """
 
-        for obj in self.hexagons:
-            for j, p in enumerate(self.player.pos_list):
-                pos1 = [p[0] + i.pos[0],
-                        p[1] + i.pos[1]]
-                pos2 = [round(pos1[0] + math.sin(deg_to_rad(j * 60 + 120)) * self.hexagon_grid_length),
-                        round(pos1[1] + math.cos(deg_to_rad((j * 60 + 120))) * self.hexagon_grid_length)]
-                if touched(obj.pos[0] + Hexagon.surface_size[0] / 2, Hexagon.surface_size[0] / 2, pos2[0], 1,
-                           obj.pos[1] + Hexagon.surface_size[0] / 2, Hexagon.surface_size[0] / 2, pos2[1], 1):
-                    self.lines.append(Line(self, pos1, pos2, color=self.grid_line_color))
+        for x1, y1, x2, y2, x3, y3, x4, y4 in self.compiled_map.lines.tolist():
+            self.lines.append(Line(self, [x1, y1], [x2, y2], color=self.grid_line_color, back=[[x3, y3], [x4, y4]]))
+
+    def center_camera(self, cell):
+        """ Moves camera to the hexagon on given grid map position """
+
+        self.center_camera_at(get_cell_positions(np.array([cell]), self.hexagon_size)[0])
+
+    def center_camera_at(self, pos):
+        """ Moves camera to the hexagon with given world position """
+
+        self.cords = [self.app.WIDTH / 2 - (pos[0] + Hexagon.surface_size[0] / 2) * self.zoom,
+                      self.app.HEIGHT / 2 - (pos[1] + Hexagon.surface_size[1] / 2) * self.zoom]
+
+    def screen_to_world(self, pos) -> list:
+        """ Returns world position of the hexagon that has its center on given screen position """
+
+        return [(pos[0] - self.cords[0]) / self.zoom - Hexagon.surface_size[0] / 2,
+                (pos[1] - self.cords[1]) / self.zoom - Hexagon.surface_size[1] / 2]
+
+    def get_world_rect(self, rect) -> list:
+        """ Returns rectangle of the world that is shown in given [x, y, width, height] rectangle of the screen """
+
+        return [(rect[0] - self.cords[0]) / self.zoom, (rect[1] - self.cords[1]) / self.zoom,
+                rect[2] / self.zoom, rect[3] / self.zoom]
+
+    def get_zoom_levels(self) -> list:
+        """ Returns zoom factors of all zoom levels from the smallest one """
+
+        return [size / self.hexagon_size
+                for size in range(self.min_hexagon_size, self.max_hexagon_size + 1, self.zoom_step)]
+
+    def zoom_camera(self, steps, pos):
+        """
+        Changes zoom level by given number of steps keeping the point under given screen position in place.
+        World positions stay the same, hexagons and lines are scaled when they are drawn.
+        """
+
+        zooms = self.get_zoom_levels()
+        current = min(range(len(zooms)), key=lambda i: abs(zooms[i] - self.zoom))
+        zoom = zooms[min(max(current + steps, 0), len(zooms) - 1)]
+        if zoom != self.zoom:
+            self.cords = [pos[0] - (pos[0] - self.cords[0]) * zoom / self.zoom,
+                          pos[1] - (pos[1] - self.cords[1]) * zoom / self.zoom]
+            self.zoom = zoom
+            self.app.renderer.invalidate()
 
     def new_game(self):
         """ game variables that you need to reset to make a new game """
@@ -274,23 +325,58 @@ class Game:
         self.LOSE = False
 
         # game variables that you don't need to change here
+        self.zoom = 1
         self.cords = [-1385 + self.app.WIDTH / 2 - Hexagon.surface_size[0],
                       -2250 + self.app.HEIGHT / 2 - Hexagon.surface_size[1]]
-        self.counter = 1
+        self.last_tick_time = time.perf_counter()
+        self.tick_time_left = 0
         self.hexagon_grid_length = self.hexagon_size * 2
         self.selected_hexagon = None
-        self.selected_enemy_hexagon = None
         self.nearby_hexagons = []
-        self.nearby_enemy_hexagons = []
-        self.player_hexagons = []
-        self.enemy_hexagons = []
 
         # game map variables
         self.hexagons = []
         self.lines = []
-        self.grid_map_image = pygame.transform.rotate(pygame.image.load("maps/two-way.png"), 90)
-        self.grid_map = [[1 if self.grid_map_image.get_at((x, y)) == (0, 0, 0, 255) else 0 for x in
-                          range(self.grid_map_image.get_size()[0])] for y in range(self.grid_map_image.get_size()[1])]
+        self.map_name = self.map_options.get_current_option()
+        self.map_seed = None
+        self.human = PLAYER
+        players = self.players_options.get_current_option()
+        if self.network is not None:
+            self.map_name = self.network.header["map"]
+            self.map_seed = self.network.header["map_seed"]
+            self.start_cells = [tuple(cell) for cell in self.network.header["start_cells"]]
+            self.human = self.network.player
+            if self.map_name in MAP_FILES:
+                self.compiled_map = load_map(MAP_FILES[self.map_name][0], self.hexagon_size, self.grid_hex_width)
+            else:
+                self.compiled_map = compile_grid_map(self.network.grid_map, self.hexagon_size, self.grid_hex_width)
+            self.center_camera(self.start_cells[self.human - 1])
+        elif self.replay is not None:
+            self.map_name = self.replay.header.get("map")
+            self.start_cells = [tuple(cell) for cell in self.replay.header["start_cells"]]
+            self.compiled_map = compile_grid_map(self.replay.grid_map, self.hexagon_size, self.grid_hex_width)
+            self.center_camera(self.start_cells[0])
+        elif self.snapshot is not None:
+            self.map_name = self.snapshot.get_text("map")
+            self.map_seed = self.snapshot.get_seed("map_seed")
+            self.start_cells = self.snapshot.get_roots()
+            if self.map_name in MAP_FILES:
+                self.compiled_map = load_map(MAP_FILES[self.map_name][0], self.hexagon_size, self.grid_hex_width)
+            else:
+                self.compiled_map = compile_grid_map(self.snapshot.grid_map, self.hexagon_size, self.grid_hex_width)
+            self.cords = self.snapshot.header["cords"].tolist()
+        elif self.map_name in MAP_FILES:
+            path, start_cells = MAP_FILES[self.map_name]
+            self.compiled_map = load_map(path, self.hexagon_size, self.grid_hex_width)
+            self.map_seed = random.randrange(2 ** 32)
+            self.start_cells = get_start_cells(self.compiled_map.grid_map, start_cells, players, self.map_seed)
+        else:
+            self.map_seed = random.randrange(2 ** 32)
+            grid_map, self.start_cells = generate_map(self.map_seed, GENERATED_MAP_SIZES[self.map_name],
+                                                      start_count=players)
+            self.compiled_map = compile_grid_map(grid_map, self.hexagon_size, self.grid_hex_width)
+            self.center_camera(self.start_cells[0])
+        self.grid_map = self.compiled_map.grid_map
         self.grid_map_size = [len(self.grid_map) * (self.hexagon_size + self.hexagon_grid_length),
                               len(self.grid_map[0]) * (self.hexagon_size + self.hexagon_grid_length)]
 
@@ -302,31 +388,26 @@ class Game:
         self.nearby_hexagon_color = self.nearby_hexagon_color_picker.get_current_option()
         self.enemy_color = self.enemy_color_picker.get_current_option()
         self.game_mode = self.game_mode_options.get_current_option()
-
-        # changing difficulty
-        if self.difficulty == "Easy":
-            self.player_wait_ticks = 120
-            self.enemy_wait_ticks = 180
-        if self.difficulty == "Normal":
-            self.player_wait_ticks = 120
-            self.enemy_wait_ticks = 120
-        if self.difficulty == "Hard":
-            self.player_wait_ticks = 180
-            self.enemy_wait_ticks = 120
-        if self.difficulty == "Super Hard":
-            self.player_wait_ticks = 240
-            self.enemy_wait_ticks = 120
-
-        # changing speed
-        if self.speed == "Slow":
-            self.player_wait_ticks /= 0.5
-            self.enemy_wait_ticks /= 0.5
-        if self.speed == "Fast":
-            self.player_wait_ticks /= 2
-            self.enemy_wait_ticks /= 2
-        if self.speed == "Super Fast":
-            self.player_wait_ticks /= 4
-            self.enemy_wait_ticks /= 4
+        if self.snapshot is not None:
+            self.difficulty = self.snapshot.get_text("difficulty")
+            self.speed = self.snapshot.get_text("speed")
+            self.game_mode = self.snapshot.get_text("game_mode")
+        if self.network is not None:
+            self.difficulty = self.network.header["difficulty"]
+            self.speed = self.network.header["speed"]
+            self.game_mode = self.network.header["game_mode"]
+
+        # changing difficulty and speed, all players except the human are bots
+        human_wait_ticks, bot_wait_ticks = DIFFICULTY_WAIT_TICKS[self.difficulty]
+        self.wait_ticks = [(human_wait_ticks if player == self.human else bot_wait_ticks) / SPEED_FACTORS[self.speed]
+                           for player in range(1, len(self.start_cells) + 1)]
+
+        # the human has its own color, other players get the enemy color and then the colors that aren't used
+        used_colors = [self.player_color, self.enemy_color, self.selected_hexagon_color, self.nearby_hexagon_color]
+        other_colors = [self.enemy_color] + [color for color in self.colors if color not in used_colors]
+        others = [player for player in range(1, len(self.start_cells) + 1) if player != self.human]
+        self.owner_colors = dict(zip(others, other_colors))
+        self.owner_colors[self.human] = self.player_color
 
         # changing game mode
         if self.game_mode == "Fast":
@@ -343,22 +424,116 @@ class Game:
 
         self.create_hex_grid()
 
-        for i in self.hexagons:
-            if isinstance(i, Hexagon):
-                if i.hex_pos == [8, 15]:
-                    self.player = i
-                if i.hex_pos == [8, 1]:
-                    self.enemy = i
-        self.player.set_color(self.player_color)
-        self.player.set_energy(1)
-
-        self.enemy.set_color(self.enemy_color)
-        self.enemy.set_energy(1)
+        if self.network is not None:
+            # board of the network match is changed only by updates from the server
+            self.simulation = self.network.simulation
+            self.seed = self.network.header["seed"]
+        elif self.replay is not None:
+            self.simulation = self.replay.create_simulation()
+            self.replay.seek(self.simulation, self.replay_start_tick)
+            self.replay_tick_time = 0
+            self.replay_label = Label(self, font_size=40).percent(50, 4)
+        else:
+            if self.snapshot is not None:
+                self.simulation = self.snapshot.create_simulation(self.compiled_map.neighbours)
+                self.seed = self.snapshot.get_seed("seed")
+            else:
+                self.seed = random.randrange(2 ** 32)
+                self.simulation = Simulation(self.grid_map, self.start_cells, self.max_energy, self.wait_ticks,
+                                             neighbours=self.compiled_map.neighbours, seed=self.seed)
+            if self.difficulty == "Super Hard":
+                # bots search their next moves during the wait between their turns, sharing CPUs and the wait
+                bots = list(self.simulation.bots)
+                workers = max(1, min(4, os.cpu_count() or 1) // len(bots))
+                for bot in bots:
+                    self.simulation.bots[bot] = RolloutBot(
+                        self.simulation, workers=workers,
+                        time_budget=self.simulation.wait_ticks[bot] / self.tick_rate / 2 / len(bots))
+            if self.RECORDING_ENABLED:
+                os.makedirs("replays", exist_ok=True)
+                self.recorder = ReplayWriter(os.path.join("replays", time.strftime("%Y%m%d-%H%M%S.rwr")),
+                                             self.simulation, map=self.map_name, map_seed=self.map_seed,
+                                             seed=self.seed, difficulty=self.difficulty, speed=self.speed,
+                                             game_mode=self.game_mode)
+        self.hexagon_by_cell = {tuple(i.hex_pos): i for i in self.hexagons}
+        self.player = self.hexagon_by_cell[self.simulation.roots[self.human]]
+        self.minimap = Minimap(self, self.compiled_map.cells)
+        self.minimap.patch(self.compiled_map.cells, self.simulation.owner[tuple(self.compiled_map.cells.T)],
+                           self.owner_colors)
+        self.sync_hexagons()
 
         self.selected_hexagon = None
+        if self.snapshot is not None:
+            selected = self.snapshot.get_selected()
+            if selected is not None and self.simulation.owner[selected] == self.human:
+                self.select_hexagon(self.hexagon_by_cell[selected])
+                self.get_nearby_hexagons_for_player()
+            self.snapshot.close()
+            self.snapshot = None
+
+        self.create_hex_grid_lines()
 
+        self.hexagon_grid = SpatialGrid()
         for obj in self.hexagons:
-            self.create_hex_grid_lines(obj)
+            self.hexagon_grid.insert(obj, obj.get_rect())
+        self.map_layer = TileLayer(self, self.lines, self.hexagons)
+        self.last_tick_time = time.perf_counter()
+
+    def watch_replay(self, replay, speed=1, tick=0):
+        """ Starts playback of the replay from given tick """
+
+        self.change_mode("new game")
+        self.replay = replay
+        self.replay_speed = speed
+        self.replay_start_tick = tick
+        self.change_mode("game")
+
+    def join_match(self, client):
+        """ Starts the network match of the client that has joined it """
+
+        self.change_mode("new game")
+        self.network = client
+        self.change_mode("game")
+
+    def save_game(self):
+        """ Saves the match to be continued from the main menu """
+
+        selected = None if self.selected_hexagon is None else tuple(self.selected_hexagon.hex_pos)
+        # saved camera shows the same place of the map without zoom
+        cords = [self.app.WIDTH / 2 - (self.app.WIDTH / 2 - self.cords[0]) / self.zoom,
+                 self.app.HEIGHT / 2 - (self.app.HEIGHT / 2 - self.cords[1]) / self.zoom]
+        save_snapshot(self.save_path, self.simulation, selected, cords, self.map_name, self.map_seed, self.seed,
+                      self.difficulty, self.speed, self.game_mode)
+
+    def load_game(self):
+        """ Continues the saved match, saves of older versions are removed """
+
+        try:
+            snapshot = Snapshot(self.save_path)
+        except ValueError:
+            os.remove(self.save_path)
+            self.change_mode("main menu")
+            return
+        self.change_mode("new game")
+        self.snapshot = snapshot
+        self.change_mode("game")
+
+    def finish_game(self):
+        """ Stops worker processes of the bots, closes the replay file of the current game """
+
+        for bot in self.simulation.bots.values():
+            if bot is not None and hasattr(bot, "close"):
+                bot.close()
+        if self.recorder is not None:
+            self.recorder.close(self.simulation)
+            self.recorder = None
+            # finished match can't be continued
+            if self.simulation.winner is not None and os.path.exists(self.save_path):
+                os.remove(self.save_path)
+        if self.network is not None:
+            self.network.close()
+            self.network = None
+        self.replay = None
 
     def change_mode(self, mode):
         """
@@ -374,6 +549,9 @@ class Game:
             self.rules_objects.clear()
             self.new_game_objects.clear()
 
+        self.app.renderer.invalidate()
+        if self.mode == "game":
+            self.finish_game()
         if mode == "main menu":
             self.mode = mode
             clear()
@@ -407,6 +585,7 @@ class Game:
                 self.info_text.update_y(self.info_text.pos[1] + event.y * self.scroll_scale)
             elif event.y > 0 and self.info_text.pos[1] < self.info_text.size[1] - self.scroll_scale:
                 self.info_text.update_y(self.info_text.pos[1] + event.y * self.scroll_scale)
+            self.app.renderer.invalidate()
 
     def select_hexagon(self, obj):
         """ Selects player hexagon """
@@ -414,72 +593,134 @@ class Game:
         self.selected_hexagon = obj
         self.selected_hexagon.set_color(self.selected_hexagon_color)
 
-    def select_enemy_hexagon(self, obj):
-        """ Selects enemy hexagon """
+    def get_owner_color(self, cell):
+        """ Returns color of the hexagon owner """
 
-        self.selected_enemy_hexagon = obj
-        self.selected_enemy_hexagon.set_color(self.selected_enemy_hexagon_color)
+        return self.owner_colors.get(int(self.simulation.owner[cell]), self.grid_hex_color)
 
-    def create_player_hexagon(self, obj):
-        """ Creates player hexagon """
+    def sync_hexagons(self):
+        """ Copies energy and owner of cells changed by simulation to their hexagons """
 
-        self.selected_hexagon.set_energy(self.selected_hexagon.energy - 1)
-        obj.set_color(self.player_color)
-        obj.set_energy(1)
-        self.player_hexagons.append(obj)
-        self.selected_hexagon = obj
+        recolored = []
+        for cell in self.simulation.pop_changed():
+            obj = self.hexagon_by_cell[cell]
+            obj.set_energy(int(self.simulation.energy[cell]))
+            if obj.owner != self.simulation.owner[cell]:
+                obj.owner = int(self.simulation.owner[cell])
+                obj.set_color(self.get_owner_color(cell))
+                recolored.append(cell)
+        # only cells that changed the owner are patched on the minimap
+        self.minimap.patch(recolored, [self.hexagon_by_cell[cell].owner for cell in recolored], self.owner_colors)
 
-    def create_enemy_hexagon(self, obj):
-        """ Creates enemy hexagon """
+    def get_nearby_hexagons_for_player(self):
+        """ Locates nearby hexagons for player using neighbour table of the map """
 
-        self.selected_enemy_hexagon.set_energy(self.selected_enemy_hexagon.energy - 1)
-        obj.set_color(self.enemy_color)
-        obj.set_energy(0)
-        self.enemy_hexagons.append(obj)
-        self.selected_enemy_hexagon = obj
+        if self.selected_hexagon is not None:
+            self.nearby_hexagons.clear()
+            for cell in self.simulation.get_targets(tuple(self.selected_hexagon.hex_pos)):
+                obj = self.hexagon_by_cell[cell]
+                obj.set_color(self.nearby_hexagon_color)
+                self.nearby_hexagons.append(obj)
 
-    def get_nearby_pos(self, j, hexagon_point, selected_hexagon):
+    def get_tick_count(self):
         """
-        :param j: one of the angles of the hexagon that could be from 0 to 6 not included
-        :param hexagon_point: position of one of the angles of the hexagon
-        :param selected_hexagon: selected Hexagon object
-        :return: position of neighbor hexagon for given side for player or enemy selected hexagon
+        Returns number of simulation ticks for the time passed since the last frame.
+        Ticks run at self.tick_rate whatever the frame rate is, skipping the time that doesn't fit
+        into self.max_ticks_per_frame to let the game catch up after long frames.
         """
 
-        pos1 = [hexagon_point[0] + selected_hexagon.pos[0] + self.cords[0],
-                hexagon_point[1] + selected_hexagon.pos[1] + self.cords[1]]
-        pos2 = [round(pos1[0] + math.sin(deg_to_rad(j * 60 + 120)) * (self.hexagon_grid_length + 20)),
-                round(pos1[1] + math.cos(deg_to_rad((j * 60 + 120))) * (self.hexagon_grid_length + 20))]
-        return pos1, pos2
-
-    def get_nearby_hexagons_for_enemy(self):
-        """ Locates nearby hexagons for enemy using their position """
-
-        self.selected_enemy_hexagon = random.choice([self.enemy] + self.enemy_hexagons)
-        self.nearby_enemy_hexagons.clear()
-        for j, p in enumerate(self.player.pos_list):
-            pos1, pos2 = self.get_nearby_pos(j, p, self.selected_enemy_hexagon)
-            for obj in self.hexagons:
-                if touched(obj.pos[0] + self.cords[0] + Hexagon.surface_size[0] / 2, Hexagon.surface_size[0] / 2,
-                           pos2[0], 1,
-                           obj.pos[1] + self.cords[1] + Hexagon.surface_size[0] / 2, Hexagon.surface_size[0] / 2,
-                           pos2[1], 1) and obj not in self.enemy_hexagons:
-                    self.nearby_enemy_hexagons.append(obj)
+        now = time.perf_counter()
+        self.tick_time_left += now - self.last_tick_time
+        self.last_tick_time = now
+        ticks = int(self.tick_time_left * self.tick_rate)
+        self.tick_time_left -= ticks / self.tick_rate
+        if ticks > self.max_ticks_per_frame:
+            ticks = self.max_ticks_per_frame
+            self.tick_time_left = 0
+        return ticks
+
+    def update_replay(self, events):
+        """ Plays the replay at its speed, arrows jump 10 seconds back and forth and change the speed """
+
+        for event in events:
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_RIGHT:
+                    self.replay.seek(self.simulation, min(self.simulation.counter + self.tick_rate * 10,
+                                                          self.replay.last_tick))
+                if event.key == pygame.K_LEFT:
+                    self.replay.seek(self.simulation, max(self.simulation.counter - self.tick_rate * 10, 0))
+                if event.key == pygame.K_UP:
+                    self.replay_speed *= 2
+                if event.key == pygame.K_DOWN:
+                    self.replay_speed /= 2
+
+        self.replay_tick_time += self.get_tick_count() * self.replay_speed
+        ticks = int(self.replay_tick_time)
+        self.replay_tick_time -= ticks
+        self.replay.seek(self.simulation, min(self.simulation.counter + ticks, max(self.replay.last_tick,
+                                                                                   self.simulation.counter)))
+        self.replay_label.update_text(f"Replay x{self.replay_speed:g}  {self.simulation.counter // self.tick_rate} s"
+                                      f" / {self.replay.last_tick // self.tick_rate} s")
+
+    def get_mode_objects(self):
+        """ Returns UI objects of current mode """
 
-    def get_nearby_hexagons_for_player(self):
-        """ Locates nearby hexagons for enemy using their position """
+        if self.mode == "main menu":
+            return self.main_menu_objects
+        if self.mode == "settings":
+            return self.settings_objects
+        if self.mode == "info":
+            return self.info_objects
+        if self.mode == "rules":
+            return self.rules_objects
+        if self.mode == "new game":
+            return self.new_game_objects
+        return []
 
-        if self.selected_hexagon is not None:
-            self.nearby_hexagons.clear()
-            for j, p in enumerate(self.player.pos_list):
-                pos1, pos2 = self.get_nearby_pos(j, p, self.selected_hexagon)
-                for obj in self.hexagons:
-                    if touched(obj.pos[0] + self.cords[0] + Hexagon.surface_size[0] / 2, Hexagon.surface_size[0] / 2,
-                               pos2[0], 1,
-                               obj.pos[1] + self.cords[1] + Hexagon.surface_size[0] / 2, Hexagon.surface_size[0] / 2,
-                               pos2[1], 1) and obj not in self.player_hexagons:
-                        obj.set_color(self.nearby_hexagon_color)
-                        self.nearby_hexagons.append(obj)
+    def redraw_hexagons(self):
+        """ Redraws visible hexagons that have changed since the last frame in one pass """
+
+        for obj in self.hexagon_grid.query(self.get_world_rect([0, 0, self.app.WIDTH, self.app.HEIGHT])):
+            obj.redraw()
+
+    def draw(self, rect):
+        """ Draws everything of current mode that intersects given screen rectangle """
+
+        self.app.DISPLAY.blit(self.background_image, rect, rect)
+
+        if self.mode == "game":
+            world_rect = self.get_world_rect(rect)
+
+            # show grid lines and empty hexagons, tiles are baked for the zoomed world
+            self.app.profiler.start("lines")
+            self.map_layer.update([rect[0] - self.cords[0], rect[1] - self.cords[1], rect[2], rect[3]])
+            self.app.profiler.stop("lines")
+
+            # show grid hexagons
+            self.app.profiler.start("hexagons")
+            for obj in self.hexagon_grid.query(world_rect):
+                if obj not in self.map_layer.static:
+                    obj.update()
+            self.app.profiler.stop("hexagons")
+
+            self.minimap.update()
+
+            if self.replay is not None:
+                self.replay_label.update()
+            if self.WIN:
+                self.win_label.update()
+                self.back_button.update()
+            if self.LOSE:
+                self.lose_label.update()
+                self.back_button.update()
+        else:
+            for obj in self.get_mode_objects():
+                obj.update()
+
+        if self.FPS_ENABLED:
+            self.fps_label.update()
+        if self.PROFILER_ENABLED:
+            self.profiler_overlay.update()
 
     def update(self, mouse_buttons, mouse_position, events, keys):
         """ Main game logic """
@@ -519,12 +760,15 @@ class Game:
         #     #         self.bloom_objects[0].alpha = 0
         #     #     print(self.bloom_objects[0].alpha)
 
-        if self.mode == "main menu":
-            self.app.DISPLAY.blit(self.background_image, (0, 0))
-
-            for obj in self.main_menu_objects:
-                obj.update()
+        if self.mode == "game":
+            self.app.profiler.start("redraw")
+            self.redraw_hexagons()
+            self.app.profiler.stop("redraw")
+        self.app.renderer.draw(self.draw)
 
+        if self.mode == "main menu":
+            if self.continue_button is not None and self.continue_button.clicked(mouse_buttons, mouse_position):
+                self.load_game()
             if self.play_button.clicked(mouse_buttons, mouse_position):
                 self.change_mode("new game")
             if self.settings_button.clicked(mouse_buttons, mouse_position):
@@ -537,33 +781,35 @@ class Game:
                 self.app.RUN = False
 
         if self.mode == "settings":
-            self.app.DISPLAY.blit(self.background_image, (0, 0))
-
-            for obj in self.settings_objects:
-                obj.update()
-
             for event in events:
                 if event.type == pygame.MOUSEWHEEL:
                     if event.y < 0 and self.info_text.pos[1] > -self.info_text.size[1]:
                         self.info_text.update_y(self.info_text.pos[1] + event.y * self.scroll_scale, 100)
                     elif event.y > 0 and self.info_text.pos[1] < self.info_text.size[1] - self.scroll_scale:
                         self.info_text.update_y(self.info_text.pos[1] + event.y * self.scroll_scale, 100)
+                    self.app.renderer.invalidate()
+
+            self.rendering_options.clicked(mouse_buttons, mouse_position)
+            self.app.renderer.enabled = self.rendering_options.get_current_option() == "Dirty rects"
 
             if self.fps_button.clicked(mouse_buttons, mouse_position):
                 self.FPS_ENABLED = not self.FPS_ENABLED
+                self.app.renderer.invalidate()
                 if self.FPS_ENABLED:
                     self.fps_button.update_text("Hide fps")
                 else:
                     self.fps_button.update_text("Show fps")
+            if self.profiler_button.clicked(mouse_buttons, mouse_position):
+                self.PROFILER_ENABLED = not self.PROFILER_ENABLED
+                self.app.renderer.invalidate()
+                if self.PROFILER_ENABLED:
+                    self.profiler_button.update_text("Hide profiler")
+                else:
+                    self.profiler_button.update_text("Show profiler")
             if self.back_button.clicked(mouse_buttons, mouse_position):
                 self.change_mode("main menu")
 
         if self.mode == "info":
-            self.app.DISPLAY.blit(self.background_image, (0, 0))
-
-            for obj in self.info_objects:
-                obj.update()
-
             for event in events:
                 self.scroll_info_text(event)
 
@@ -571,11 +817,6 @@ class Game:
                 self.change_mode("main menu")
 
         if self.mode == "rules":
-            self.app.DISPLAY.blit(self.background_image, (0, 0))
-
-            for obj in self.rules_objects:
-                obj.update()
-
             for event in events:
                 self.scroll_info_text(event)
 
@@ -583,11 +824,6 @@ class Game:
                 self.change_mode("main menu")
 
         if self.mode == "new game":
-            self.app.DISPLAY.blit(self.background_image, (0, 0))
-
-            for obj in self.new_game_objects:
-                obj.update()
-
             self.difficulty_options.clicked(mouse_buttons, mouse_position)
             self.speed_options.clicked(mouse_buttons, mouse_position)
             self.player_color_picker.clicked(mouse_buttons, mouse_position)
@@ -596,6 +832,7 @@ class Game:
             self.nearby_hexagon_color_picker.clicked(mouse_buttons, mouse_position)
             self.game_mode_options.clicked(mouse_buttons, mouse_position)
             self.map_options.clicked(mouse_buttons, mouse_position)
+            self.players_options.clicked(mouse_buttons, mouse_position)
 
             if self.start_game_button.clicked(mouse_buttons, mouse_position):
                 self.change_mode("game")
@@ -604,147 +841,129 @@ class Game:
                 self.change_mode("main menu")
 
         if self.mode == "game":
-            self.app.DISPLAY.blit(self.background_image, (0, 0))
-            # self.app.DISPLAY.fill((0, 0, 0))
-
-            if not self.WIN and not self.LOSE:
+            self.app.profiler.start("events")
+            # minimap click moves camera to the clicked point of the map
+            # mouse wheel zooms the map around the mouse
+            for event in events:
+                if event.type == pygame.MOUSEBUTTONDOWN and event.button == pygame.BUTTON_LEFT and \
+                        self.minimap.contains(mouse_position):
+                    self.center_camera_at(self.minimap.minimap_to_world(mouse_position))
+                    self.app.renderer.invalidate()
+                if event.type == pygame.MOUSEWHEEL:
+                    self.zoom_camera(event.y, mouse_position)
+            if not self.WIN and not self.LOSE and self.replay is None:
                 for event in events:
-                    if event.type == pygame.MOUSEBUTTONDOWN and not self.FIRST_ITERATION:
+                    # mouse wheel also sends button events, only left clicks select and move
+                    if event.type == pygame.MOUSEBUTTONDOWN and event.button == pygame.BUTTON_LEFT and \
+                            not self.FIRST_ITERATION and not self.minimap.contains(mouse_position):
                         # set colors
-                        for i, obj in enumerate(self.hexagons):
-                            if obj == self.player or obj in self.player_hexagons:
-                                obj.set_color(self.player_color)
-                            elif obj == self.enemy or obj in self.enemy_hexagons:
-                                obj.set_color(self.enemy_color)
-                            elif obj in self.nearby_hexagons:
-                                obj.set_color(self.grid_hex_color)
-                            else:
-                                obj.set_color(self.grid_hex_color)
+                        for obj in [self.selected_hexagon] + self.nearby_hexagons:
+                            if obj is not None:
+                                obj.set_color(self.get_owner_color(tuple(obj.hex_pos)))
                         # player logic
-                        for i, obj in enumerate(self.hexagons):
-                            if touched(obj.pos[0] + self.cords[0] + Hexagon.surface_size[0] / 2,
-                                       Hexagon.surface_size[0] / 2, mouse_position[0], 1,
-                                       obj.pos[1] + self.cords[1] + Hexagon.surface_size[0] / 2,
-                                       Hexagon.surface_size[0] / 2, mouse_position[1], 1):
-                                if obj == self.player or obj in self.player_hexagons and obj.energy > 1:
+                        mouse_rect = self.get_world_rect([mouse_position[0], mouse_position[1], 1, 1])
+                        radius = Hexagon.surface_size[0] / 2 * self.zoom
+                        for i, obj in enumerate(self.hexagon_grid.query(mouse_rect)):
+                            if touched(obj.pos[0] * self.zoom + self.cords[0] + radius, radius, mouse_position[0], 1,
+                                       obj.pos[1] * self.zoom + self.cords[1] + radius, radius, mouse_position[1], 1):
+                                cell = tuple(obj.hex_pos)
+                                if self.simulation.owner[cell] == self.human and \
+                                        (obj == self.player or self.simulation.energy[cell] > 1):
                                     self.select_hexagon(obj)
                                     self.get_nearby_hexagons_for_player()
-                                if obj in self.nearby_hexagons and self.selected_hexagon is not None and \
-                                        self.selected_hexagon.energy > 1:
-                                    if obj == self.enemy or obj in self.enemy_hexagons:
-                                        energy = self.selected_hexagon.energy - 1
-                                        obj.set_energy(obj.energy - energy)
-                                        self.selected_hexagon.set_energy(self.selected_hexagon.energy - energy)
-                                        if obj.energy <= 0:
-                                            if obj == self.enemy:
-                                                self.WIN = True
-                                                break
-                                            else:
-                                                self.enemy_hexagons.remove(obj)
-                                                self.player_hexagons.append(obj)
-                                                obj.set_energy(-obj.energy)
-                                                obj.set_color(self.player_color)
-                                    else:
-                                        self.create_player_hexagon(obj)
-                                        self.select_hexagon(obj)
-                                        self.get_nearby_hexagons_for_player()
+                                    if self.recorder is not None:
+                                        self.recorder.select(self.simulation, self.human, cell)
+                                if obj in self.nearby_hexagons and self.selected_hexagon is not None:
+                                    grow = self.simulation.owner[cell] == NEUTRAL
+                                    source = tuple(self.selected_hexagon.hex_pos)
+                                    if self.network is not None:
+                                        # the server makes the move, its result comes with the next update
+                                        self.network.move(source, cell)
+                                    elif self.simulation.move(source, cell):
+                                        if self.recorder is not None:
+                                            self.recorder.move(self.simulation, self.human, source, cell,
+                                                               not grow)
+                                        self.sync_hexagons()
+                                        if grow:
+                                            self.select_hexagon(obj)
+                                            self.get_nearby_hexagons_for_player()
                                     break
+            self.app.profiler.stop("events")
 
             # user input handling
             if keys[pygame.K_ESCAPE]:
+                # match of the human that has lost its root goes on without them, so it's not saved
+                if self.replay is None and self.network is None and self.simulation.winner is None and \
+                        self.simulation.get_alive()[self.human - 1]:
+                    self.save_game()
                 self.change_mode("main menu")
+                # bots of the finished game are closed, so it must not tick anymore
+                return
 
             # game map navigation
+            last_cords = list(self.cords)
+            map_size = [size * self.zoom for size in self.grid_map_size]
             # top
-            if mouse_position[1] - self.map_move_reaction < 0 and self.cords[1] < self.grid_map_size[1] / 8:
+            if mouse_position[1] - self.map_move_reaction < 0 and self.cords[1] < map_size[1] / 8:
                 self.cords[1] += self.navigation_speed * self.app.delta_time * self.app.MAX_FPS
             # bottom
-            if mouse_position[1] + self.map_move_reaction > self.app.HEIGHT and self.cords[1] > -self.grid_map_size[1] / 2:
+            if mouse_position[1] + self.map_move_reaction > self.app.HEIGHT and self.cords[1] > -map_size[1] / 2:
                 self.cords[1] -= self.navigation_speed * self.app.delta_time * self.app.MAX_FPS
             # left
-            if mouse_position[0] - self.map_move_reaction < 0 and self.cords[0] < self.grid_map_size[0] / 8:
+            if mouse_position[0] - self.map_move_reaction < 0 and self.cords[0] < map_size[0] / 8:
                 self.cords[0] += self.navigation_speed * self.app.delta_time * self.app.MAX_FPS
             # right
-            if mouse_position[0] + self.map_move_reaction > self.app.WIDTH and self.cords[0] > -self.grid_map_size[0] / 2:
+            if mouse_position[0] + self.map_move_reaction > self.app.WIDTH and self.cords[0] > -map_size[0] / 2:
                 self.cords[0] -= self.navigation_speed * self.app.delta_time * self.app.MAX_FPS
-
-            # show grid lines
-            for obj in self.lines:
-                obj.update()
-
-            # show grid hexagons
-            for i, obj in enumerate(self.hexagons):
-                obj.update()
-
-            if not self.WIN and not self.LOSE:
-                if self.counter % self.player_wait_ticks == 0:
-                    # increasing player energy
-                    for obj in self.player_hexagons:
-                        if obj.energy < self.max_energy:
-                            obj.set_energy(obj.energy + 1)
-                    if self.player.energy < self.max_energy:
-                        self.player.set_energy(self.player.energy + 1)
-
-                # bot logic
-                if self.counter % self.enemy_wait_ticks == 0:
-                    self.get_nearby_hexagons_for_enemy()
-                    for obj in self.hexagons:
-                        if obj in self.nearby_enemy_hexagons and self.selected_enemy_hexagon is not None and \
-                                self.selected_enemy_hexagon.energy > 1:
-                            if obj in self.player_hexagons:
-                                energy = self.selected_enemy_hexagon.energy - 1
-                                obj.set_energy(obj.energy - energy)
-                                self.selected_enemy_hexagon.set_energy(self.selected_enemy_hexagon.energy - energy)
-                                if obj.energy <= 0:
-                                    self.player_hexagons.remove(obj)
-                                    self.enemy_hexagons.append(obj)
-                                    obj.set_energy(-obj.energy)
-                                    obj.set_color(self.enemy_color)
-                            else:
-                                self.create_enemy_hexagon(obj)
-                            break
-                    # increasing bot energy
-                    for obj in [self.enemy] + self.enemy_hexagons:
-                        if obj.energy < self.max_energy:
-                            obj.set_energy(obj.energy + 1)
-
-            # win
-            if len(self.player_hexagons) == len(self.hexagons) - 1:
-                self.WIN = True
-            # lose
-            if self.player in self.enemy_hexagons:
-                self.LOSE = True
-
-            if self.WIN:
-                self.win_label.update()
-                self.back_button.update()
-
+            if self.cords != last_cords:
+                self.app.renderer.invalidate()
+
+            # simulation ticks with fixed timestep
+            self.app.profiler.start("simulation")
+            bot_time = self.simulation.bot_time
+            if self.replay is not None:
+                self.update_replay(events)
+            elif self.network is not None:
+                self.network.poll()
+                if self.network.error is not None and self.simulation.winner is None:
+                    # nobody wins the match that was cut off
+                    self.lose_label.update_text("Connection lost")
+                    self.simulation.winner = NEUTRAL
+            else:
+                for i in range(self.get_tick_count()):
+                    self.simulation.step()
+                    if self.WIN and self.simulation.counter % 12 == 0:
+                        self.selected_hexagon = self.simulation.random.choice(self.hexagons)
+                        self.selected_hexagon.set_color(self.player_color)
+                    # the other players can go on after the human has lost its root
+                    if self.LOSE and self.simulation.winner is not None and self.simulation.counter % 12 == 0:
+                        self.selected_hexagon = self.simulation.random.choice(self.hexagons)
+                        self.selected_hexagon.set_color(self.enemy_color)
+            self.sync_hexagons()
+            self.app.profiler.stop("simulation")
+            self.app.profiler.add("simulation", bot_time - self.simulation.bot_time)
+            self.app.profiler.add("bot", self.simulation.bot_time - bot_time)
+
+            # replays can go back to the time before the end of the game
+            win = self.simulation.winner == self.human
+            lose = not win and (self.simulation.winner is not None or not self.simulation.get_alive()[self.human - 1])
+            if win != self.WIN or lose != self.LOSE:
+                self.app.renderer.invalidate()
+            self.WIN = win
+            self.LOSE = lose
+
+            if self.WIN or self.LOSE:
                 if self.back_button.clicked(mouse_buttons, mouse_position):
                     self.change_mode("main menu")
 
-                if self.counter % 12 == 0:
-                    self.selected_hexagon = random.choice(self.hexagons)
-                    self.selected_hexagon.set_color(self.player_color)
-
-            if self.LOSE:
-                self.lose_label.update()
-                self.back_button.update()
-
-                if self.back_button.clicked(mouse_buttons, mouse_position):
-                    self.change_mode("main menu")
-
-                if self.counter % 12 == 0:
-                    self.selected_hexagon = random.choice(self.hexagons)
-                    self.selected_hexagon.set_color(self.enemy_color)
-
-            self.counter += 1
-            if self.counter > 2000:
-                self.counter = 0
-
-            if self.FIRST_ITERATION and self.counter % 30 == 0:
+            if self.FIRST_ITERATION and self.simulation.counter > 30:
                 self.FIRST_ITERATION = False
 
         # things that settings change
         if self.FPS_ENABLED:
             self.fps_label.update_text(round(self.app.CLOCK.get_fps()))
-            self.fps_label.update()
+        if self.PROFILER_ENABLED:
+            self.profiler_overlay.refresh()
+            for event in events:
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F12:
+                    self.app.profiler.dump(time.strftime("profile-%Y%m%d-%H%M%S.json"))